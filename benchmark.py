@@ -0,0 +1,44 @@
+import time
+import tracemalloc
+from os import sep
+
+import pandas as pd
+
+from impl import FullQueryEngine
+
+# Measures how long the query engine takes to turn a query result frame into
+# Journal objects, using the whole DOAJ dump shaped like a JournalQueryHandler
+# result. No handler is attached, so only materialization is measured.
+journal = "data" + sep + "doaj.csv"
+runs = 5
+
+df = pd.read_csv(journal, keep_default_na=False, dtype=str)
+df = pd.DataFrame({
+    "title": df["Journal title"],
+    "identifier": df["Journal ISSN (print version)"] + "," + df["Journal EISSN (online version)"],
+    "languages": df["Languages in which the journal accepts manuscripts"],
+    "publisher": df["Publisher"],
+    "seal": df["DOAJ Seal"],
+    "licence": df["Journal license"],
+    "apc": df["APC"],
+})
+
+engine = FullQueryEngine()
+
+timings = []
+for run in range(runs):
+    start = time.perf_counter()
+    journals = engine.buildJournals(df)
+    timings.append(time.perf_counter() - start)
+
+del journals
+tracemalloc.start()
+journals = engine.buildJournals(df)
+retained, peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+best = min(timings)
+print(f"rows: {len(journals)}")
+print(f"best of {runs}: {best:.3f} s")
+print(f"per row: {best / len(journals) * 1e6:.2f} us")
+print(f"retained: {retained / 2**20:.1f} MiB, peak: {peak / 2**20:.1f} MiB")
@@ -1,3 +1,6 @@
 from .models import *
+from .caches import *
+from .indexes import *
 from .handlers import *
+from .snapshots import *
 from .engines import *
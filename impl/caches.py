@@ -0,0 +1,165 @@
+import inspect
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from functools import wraps
+
+class ResultCache:
+    watchers = {}
+    watchersLock = threading.Lock()
+
+    def __init__(self, maxSize=128, ttl=300):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self.entries[key]
+
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+        return True
+
+    def getStats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries),
+                    "maxSize": self.maxSize, "ttl": self.ttl}
+
+    def watch(self, dbPathOrUrl):
+        return watchLocation(self, dbPathOrUrl)
+
+class EntityDirectory:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.entries = None
+        self.expires = None
+        self.lock = threading.Lock()
+
+    def lookup(self, id):
+        with self.lock:
+            if self.entries is None:
+                return False, None
+            if self.expires is not None and self.expires <= time.monotonic():
+                self.entries = None
+                return False, None
+
+            return True, self.entries.get(id)
+
+    def fill(self, entries):
+        with self.lock:
+            self.entries = entries
+            self.expires = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.entries = None
+            self.expires = None
+
+        return True
+
+    def watch(self, dbPathOrUrl):
+        return watchLocation(self, dbPathOrUrl)
+
+def watchLocation(watcher, dbPathOrUrl):
+    if not dbPathOrUrl:
+        return False
+
+    with ResultCache.watchersLock:
+        watchers = ResultCache.watchers.setdefault(normalizeLocation(dbPathOrUrl), weakref.WeakSet())
+        watchers.add(watcher)
+
+    return True
+
+def normalizeLocation(dbPathOrUrl):
+    if "://" in dbPathOrUrl:
+        return dbPathOrUrl.rstrip("/")
+    return os.path.abspath(dbPathOrUrl)
+
+def invalidateCaches(dbPathOrUrl):
+    with ResultCache.watchersLock:
+        caches = list(ResultCache.watchers.get(normalizeLocation(dbPathOrUrl), ()))
+
+    for cache in caches:
+        cache.clear()
+
+    return True
+
+def normalizeArgument(value):
+    if isinstance(value, (set, frozenset)):
+        return frozenset(normalizeArgument(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(normalizeArgument(item) for item in value)
+    if isinstance(value, dict):
+        return frozenset((key, normalizeArgument(item)) for key, item in value.items())
+    return value
+
+def copyResult(value):
+    if isinstance(value, list):
+        return list(value)
+    if hasattr(value, "copy") and not isinstance(value, (str, tuple)):
+        return value.copy()
+    return value
+
+def cached(method):
+    if inspect.iscoroutinefunction(method):
+        @wraps(method)
+        async def asyncWrapper(self, *args, **kwargs):
+            cache = self.cache
+            if cache is None:
+                return await method(self, *args, **kwargs)
+
+            key = (method.__name__, normalizeArgument(args), normalizeArgument(kwargs))
+            found, value = cache.get(key)
+            if not found:
+                value = await method(self, *args, **kwargs)
+                cache.put(key, value)
+
+            return copyResult(value)
+
+        return asyncWrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self.cache
+        if cache is None:
+            return method(self, *args, **kwargs)
+
+        key = (method.__name__, normalizeArgument(args), normalizeArgument(kwargs))
+        found, value = cache.get(key)
+        if not found:
+            value = method(self, *args, **kwargs)
+            cache.put(key, value)
+
+        # Callers get their own copy so they cannot alter the cached result
+        return copyResult(value)
+
+    return wrapper
@@ -1,272 +1,1208 @@
 from impl.models import Category, Area, Journal
 from impl.handlers import CategoryQueryHandler, JournalQueryHandler
-
+from impl.caches import EntityDirectory, ResultCache, cached
+from impl.indexes import BitmapIndex, SearchIndex, foldText
+from impl.snapshots import Snapshot
+
+import asyncio
+import inspect
+import sys
+import threading
+from itertools import repeat
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
 import pandas as pd
 
 class BasicQueryEngine:
-    def __init__(self):
+    # One id query's worth of ISSNs, the way JournalQueryHandler chunks getJournalsByIds
+    FETCH_LIMIT = 200
+
+    FLAG_COLUMNS = ("identifier", "seal", "licence", "apc")
+
+    def __init__(self, workers=4, timeout=None, snapshotPath=""):
         self.journalQuery = []
         self.categoryQuery = []
+        self.snapshotPath = snapshotPath
+        self.cache = None
+        self.directory = None
+        self.searchIndex = None
+        self.bitmapIndex = None
+        self.workers = workers
+        self.timeout = timeout
+        self.executor = None
+        self.mashupExecutor = None
 
     def cleanJournalHandlers(self):
         self.journalQuery.clear()
+        self.clearIndexes()
+        if self.cache is not None:
+            self.cache.clear()
         return True
 
     def cleanCategoryHandlers(self):
         self.categoryQuery.clear()
+        self.clearIndexes()
+        if self.cache is not None:
+            self.cache.clear()
         return True
 
     def addJournalHandler(self, handler):
         self.journalQuery.append(handler)
+        self.clearIndexes()
+        self.watchIndexes(handler.getDbPathOrUrl())
+        if self.cache is not None:
+            self.cache.clear()
+            self.cache.watch(handler.getDbPathOrUrl())
         return True
 
     def addCategoryHandler(self, handler):
         self.categoryQuery.append(handler)
+        self.clearIndexes()
+        self.watchIndexes(handler.getDbPathOrUrl())
+        if self.cache is not None:
+            self.cache.clear()
+            self.cache.watch(handler.getDbPathOrUrl())
+        return True
+
+    def getSnapshotPath(self):
+        return self.snapshotPath
+
+    def setSnapshotPath(self, snapshotPath):
+        if isinstance(snapshotPath, str):
+            self.snapshotPath = snapshotPath
+            self.clearIndexes()
+            return True
+        else:
+            return False
+
+    def clearIndexes(self):
+        for index in self.getIndexes():
+            index.clear()
+        return True
+
+    def watchIndexes(self, dbPathOrUrl):
+        for index in self.getIndexes():
+            index.watch(dbPathOrUrl)
+        return True
+
+    def getIndexes(self):
+        return [index for index in (self.directory, self.searchIndex, self.bitmapIndex) if index is not None]
+
+    def enableIndexes(self, ttl=300):
+        # Like the result cache, indexes only see uploads made in this process, so they are opt-in
+        self.directory = EntityDirectory(ttl)
+        self.searchIndex = SearchIndex(ttl)
+        self.bitmapIndex = BitmapIndex(ttl)
+        for handler in self.journalQuery + self.categoryQuery:
+            self.watchIndexes(handler.getDbPathOrUrl())
+        return True
+
+    def disableIndexes(self):
+        self.directory = None
+        self.searchIndex = None
+        self.bitmapIndex = None
+        return True
+
+    def enableCache(self, maxSize=128, ttl=300):
+        self.cache = ResultCache(maxSize, ttl)
+        for handler in self.journalQuery + self.categoryQuery:
+            self.cache.watch(handler.getDbPathOrUrl())
+        return True
+
+    def disableCache(self):
+        self.cache = None
+        return True
+
+    def getCacheStats(self):
+        return self.cache.getStats() if self.cache is not None else None
+
+    def close(self):
+        for executor in (self.executor, self.mashupExecutor):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self.executor = None
+        self.mashupExecutor = None
         return True
 
+    def run(self, steps):
+        # Steps yield the handler calls they need, so the sync and async engines share one planner
+        result = None
+        while True:
+            try:
+                request = steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result = self.perform(*request)
+
+    def perform(self, kind, *args):
+        if kind == "collect":
+            return self.collectResults(*args)
+        if kind == "map":
+            return self.mapHandlers(*args)
+        if kind == "next":
+            return next(args[0], None)
+
+        first, second = args
+        return self.runBoth(lambda: self.run(first), lambda: self.run(second))
+
+    def collectSteps(self, handlers, call):
+        return (yield "collect", handlers, call)
+
+    def mapHandlers(self, handlers, call):
+        if self.workers <= 1 or (len(handlers) <= 1 and self.timeout is None):
+            return [call(handler) for handler in handlers]
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        futures = [self.executor.submit(call, handler) for handler in handlers]
+        deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+
+        results = []
+        for future in futures:
+            try:
+                remaining = max(0, deadline - time.monotonic()) if deadline is not None else None
+                results.append(future.result(timeout=remaining))
+            except TimeoutError:
+                # A handler that does not answer in time is left out of the merged result
+                future.cancel()
+
+        return results
+
+    def runBoth(self, first, second):
+        if self.workers <= 1:
+            return first(), second()
+
+        # The two halves get their own pool so their handler calls never wait on a slot they occupy
+        if self.mashupExecutor is None:
+            self.mashupExecutor = ThreadPoolExecutor(max_workers=2)
+
+        future = self.mashupExecutor.submit(second)
+        return first(), future.result()
+
+    def collectResults(self, handlers, call):
+        all_dfs = [df for df in self.mapHandlers(handlers, call) if df is not None]
+        return pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+
+    @cached
     def getEntityById(self, id):
-        all_dfs = [query.getById(id) for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
-        if not merged_df.empty:
-            return self.buildJournal(merged_df.iloc[0])
+        return self.run(self.getEntityByIdSteps(id))
+
+    def getEntityByIdSteps(self, id):
+        entry = yield from self.lookupEntitySteps(id)
+        if entry is None:
+            return None
+
+        model, store = entry
+        if store == "graph":
+            merged_df = yield "collect", self.journalQuery, lambda query: query.getById(id)
+            if not merged_df.empty:
+                return (yield from self.buildJournalSteps(merged_df.iloc[0]))
+
+        merged_df = yield "collect", self.categoryQuery, lambda query: query.getById(id)
+        if merged_df.empty:
+            return None
+
+        row = merged_df.iloc[0]
+        if row["model"] == "journal":
+            return (yield from self.buildJournalSteps(self.buildJournalStub(row)))
         else:
-            all_dfs = [query.getById(id) for query in self.categoryQuery]
-            merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
-            if merged_df.empty:
-                return None
-            else:
-                row = merged_df.iloc[0]
-                if row["model"] == "area":
-                    return Area(row["name"])
-                if row["model"] == "category":
-                    return Category(row["name"], row["quartile"])
+            return self.buildEntity(row)
+
+    @cached
+    def getEntitiesByIds(self, ids):
+        return self.run(self.getEntitiesByIdsSteps(ids))
+
+    def getEntitiesByIdsSteps(self, ids):
+        ids = list(dict.fromkeys(ids))
+        entries = {}
+        for id in ids:
+            entries[id] = yield from self.lookupEntitySteps(id)
+
+        known = [id for id in ids if entries[id] is not None]
+        graph_ids = [id for id in known if entries[id][1] == "graph"]
+
+        # Graph ids are looked up in SQLite as well, in case the directory is out of date
+        graph_df, relational_df = yield (
+            "both",
+            self.collectSteps(self.journalQuery if graph_ids else [], lambda query: query.getByIds(graph_ids)),
+            self.collectSteps(self.categoryQuery if known else [], lambda query: query.getByIds(known)),
+        )
+
+        entities, journal_df, journal_rows = self.matchEntities(ids, graph_df, relational_df)
+        journals = yield from self.buildJournalsSteps(journal_df)
+        for id, row in journal_rows.items():
+            entities[id] = journals[row]
+
+        return entities
+
+    def matchEntities(self, ids, graph_df, relational_df):
+        entities = dict.fromkeys(ids)
+        journal_rows = {}
+        all_dfs = []
+
+        if not graph_df.empty:
+            index = self.indexJournalsByIssn(graph_df)
+            index = index[~index.index.duplicated()]
+            journal_rows.update(index[index.index.isin(ids)].items())
+            all_dfs.append(graph_df)
+
+        if not relational_df.empty:
+            stubs = []
+            for row in relational_df.to_dict("records"):
+                if row["id"] in journal_rows:
+                    continue
                 if row["model"] == "journal":
-                    identifier = ",".join([row["identifier_1"], row["identifier_2"]])
-                    dict = {"identifier": identifier, "title": "", "languages": "",
-                            "publisher": None, "seal": False, "licence": "", "apc": False}
-                    return self.buildJournal(dict)
-
+                    journal_rows[row["id"]] = len(graph_df) + len(stubs)
+                    stubs.append(self.buildJournalStub(row))
+                else:
+                    entities[row["id"]] = self.buildEntity(row)
+
+            if stubs:
+                all_dfs.append(pd.DataFrame(stubs))
+
+        journal_df = pd.concat(all_dfs, ignore_index=True) if all_dfs else pd.DataFrame()
+
+        return entities, journal_df, journal_rows
+
+    def lookupEntitySteps(self, id):
+        # Without a directory every id is looked for in the graph first, then in the relational store
+        if self.directory is None:
+            return ("journal", "graph")
+
+        found, entry = self.directory.lookup(id)
+        if found:
+            return entry
+
+        relational_df, graph_df = yield (
+            "both",
+            self.collectSteps(self.categoryQuery, lambda query: query.getIdentifiers()),
+            self.collectSteps(self.journalQuery, lambda query: query.getIdentifiers()),
+        )
+        entries = self.buildDirectory(relational_df, graph_df)
+        self.directory.fill(entries)
+
+        return entries.get(id)
+
+    def buildDirectory(self, relational_df, graph_df):
+        # Later entries win: areas over categories over journals, and the graph over the relational store
+        entries = {}
+        if not relational_df.empty:
+            models = zip(relational_df["model"].tolist(), repeat("relational"))
+            entries.update(zip(relational_df["id"].tolist(), models))
+        if not graph_df.empty:
+            entries.update(dict.fromkeys(graph_df["id"].tolist(), ("journal", "graph")))
+
+        return entries
+
+    def buildEntity(self, row):
+        if row["model"] == "area":
+            return Area.intern(row["name"])
+        if row["model"] == "category":
+            quartile = row["quartile"] if pd.notna(row["quartile"]) else None
+            return Category.intern(row["name"], quartile)
+
+    def buildJournalStub(self, row):
+        identifier = ",".join(id for id in (row["identifier_1"], row["identifier_2"]) if isinstance(id, str))
+        return {"identifier": identifier, "title": "", "languages": "",
+                "publisher": None, "seal": False, "licence": "", "apc": False}
+
+    @cached
     def getAllJournals(self):
-        all_dfs = [query.getAllJournals() for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+        return self.run(self.getAllJournalsSteps())
+
+    def getAllJournalsSteps(self):
+        merged_df = yield "collect", self.journalQuery, lambda query: query.getAllJournals()
+
+        return (yield from self.buildJournalsSteps(merged_df))
+
+    def iterAllJournals(self, batchSize=1000):
+        pages = [query.iterJournalPages(batchSize) for query in self.journalQuery]
+        steps = self.iterAllJournalsSteps(pages, batchSize)
+
+        result = None
+        while True:
+            try:
+                request = steps.send(result)
+            except StopIteration:
+                return
+            if request[0] == "emit":
+                result = None
+                yield request[1]
+            else:
+                result = self.perform(*request)
+
+    def iterAllJournalsSteps(self, pages, batchSize):
+        # Every store pages through its journals in IRI order, so merging the streams puts the copies of a
+        # journal next to each other and only the current key is remembered, never the journals already seen
+        streams = [{"pages": stream, "keys": [], "rows": [], "position": 0} for stream in pages]
+        columns = None
+        rows = []
+        journals = 0
+        current = None
+        source = None
+
+        while True:
+            for stream in streams:
+                while stream["pages"] is not None and stream["position"] >= len(stream["keys"]):
+                    page_df = yield "next", stream["pages"]
+                    if page_df is None:
+                        stream["pages"] = None
+                        continue
+
+                    columns = page_df.columns.drop("journal")
+                    stream["keys"] = page_df["journal"].tolist()
+                    stream["rows"] = list(page_df[columns].itertuples(index=False, name=None))
+                    stream["position"] = 0
+
+            live = [index for index, stream in enumerate(streams) if stream["pages"] is not None]
+            if not live:
+                break
+
+            # Ties go to the first handler, whose rows then stand for the journal
+            index = min(live, key=lambda index: streams[index]["keys"][streams[index]["position"]])
+            stream = streams[index]
+            key = stream["keys"][stream["position"]]
+            row = stream["rows"][stream["position"]]
+            stream["position"] += 1
+
+            if key != current:
+                if journals == batchSize:
+                    page = yield from self.buildJournalsSteps(pd.DataFrame(rows, columns=columns))
+                    yield "emit", page
+                    rows = []
+                    journals = 0
+                current = key
+                source = index
+                journals += 1
+
+            if index == source:
+                rows.append(row)
+
+        if rows:
+            page = yield from self.buildJournalsSteps(pd.DataFrame(rows, columns=columns))
+            yield "emit", page
+
+    @cached
+    def getJournalsWithTitle(self, partialTitle):
+        return self.run(self.searchJournalsSteps("title", partialTitle,
+                                                 lambda query: query.getJournalsWithTitle(partialTitle)))
 
-        journals = []
-        for index, row in merged_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+    @cached
+    def getJournalsPublishedBy(self, partialName):
+        return self.run(self.searchJournalsSteps("publisher", partialName,
+                                                 lambda query: query.getJournalsPublishedBy(partialName)))
 
-        return journals
+    def searchJournalsSteps(self, field, term, fallback):
+        issns = yield from self.findIssnsSteps(field, term)
+        merged_df = yield from self.fetchJournalsSteps(issns, fallback)
 
-    def getJournalsWithTitle(self, partialTitle):
-        all_dfs = [query.getJournalsWithTitle(partialTitle) for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+        return (yield from self.buildJournalsSteps(self.filterJournalsByText(merged_df, field, term)))
 
-        journals = []
-        for index, row in merged_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+    def fetchJournalsSteps(self, issns, fallback):
+        # Index hits are fetched by id only while that takes one query per store; without indexes, or for
+        # broader matches, the filter runs in the graph store instead of as many id queries
+        if issns is None or len(issns) > self.FETCH_LIMIT:
+            return (yield "collect", self.journalQuery, fallback)
+        if not issns:
+            return pd.DataFrame()
 
-        return journals
+        return (yield "collect", self.journalQuery, lambda query: query.getJournalsByIds(issns))
 
-    def getJournalsPublishedBy(self, partialName):
-        all_dfs = [query.getJournalsPublishedBy(partialName) for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def findIssnsSteps(self, field, term):
+        if self.searchIndex is None:
+            return None
 
-        journals = []
-        for index, row in merged_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+        found, identifiers = self.searchIndex.search(field, term)
+        if not found:
+            terms_df = yield "collect", self.journalQuery, lambda query: query.getSearchTerms()
+            self.fillSearchIndex(terms_df)
+            found, identifiers = self.searchIndex.search(field, term)
 
-        return journals
+        return self.splitIdentifiers(identifiers)
 
-    def getJournalsWithLicense(self, licenses):
-        all_dfs = [query.getJournalsWithLicense(licenses) for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def matchJournalsSteps(self, allOf=(), anyOf=(), noneOf=()):
+        if self.bitmapIndex is None:
+            return None
 
-        journals = []
-        for index, row in merged_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+        found, identifiers = self.bitmapIndex.match(allOf, anyOf, noneOf)
+        if not found:
+            yield from self.fillBitmapIndexSteps()
+            found, identifiers = self.bitmapIndex.match(allOf, anyOf, noneOf)
 
-        return journals
+        return self.splitIdentifiers(identifiers)
 
-    def getJournalsWithAPC(self):
-        all_dfs = [query.getJournalsWithAPC() for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def countMatchingJournalsSteps(self, fallback, allOf=(), anyOf=(), noneOf=()):
+        if self.bitmapIndex is None:
+            counts = yield "map", self.journalQuery, fallback
+            return sum(counts)
 
-        journals = []
-        for index, row in merged_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+        found, count = self.bitmapIndex.count(allOf, anyOf, noneOf)
+        if not found:
+            yield from self.fillBitmapIndexSteps()
+            found, count = self.bitmapIndex.count(allOf, anyOf, noneOf)
 
-        return journals
+        return count or 0
+
+    def splitIdentifiers(self, identifiers):
+        return sorted({issn for identifier in identifiers or () for issn in identifier.split(",") if issn})
+
+    def fillSearchIndex(self, terms_df):
+        if terms_df.empty:
+            return self.searchIndex.fill([], {"title": [], "publisher": []})
+
+        return self.searchIndex.fill(terms_df["identifier"].fillna("").tolist(),
+                                     {"title": terms_df["title"].tolist(), "publisher": terms_df["publisher"].tolist()})
+
+    def fillBitmapIndexSteps(self):
+        # Upload handlers leave the flag columns in the snapshot directory, so the graph is only scanned without one
+        sources = Snapshot.openSources(self.snapshotPath, "graph", self.FLAG_COLUMNS) if self.snapshotPath else None
+        if sources is not None:
+            flags_df = sources["journals"]
+        else:
+            flags_df = yield "collect", self.journalQuery, lambda query: query.getFlags()
+
+        return self.fillBitmapIndex(flags_df)
+
+    def fillBitmapIndex(self, flags_df):
+        if flags_df.empty:
+            return self.bitmapIndex.fill([], {})
+
+        # Licences are indexed per token, the way the upload handler splits them into P275 triples
+        return self.bitmapIndex.fill(flags_df["identifier"].fillna("").tolist(), {
+            "seal": flags_df["seal"].fillna("").tolist(),
+            "apc": flags_df["apc"].fillna("").tolist(),
+            "licence": flags_df["licence"].fillna("").str.split(", ").tolist(),
+        })
+
+    def buildLicenceKeys(self, licenses):
+        return [("licence", licence) for licence in licenses]
+
+    def filterJournalsByLicense(self, df, licenses):
+        if df.empty or not licenses:
+            return df
+
+        licenses = set(licenses)
+        tokens = df["licence"].fillna("").str.split(", ")
+        mask = tokens.apply(lambda items: not licenses.isdisjoint(items))
+
+        return df[mask].reset_index(drop=True)
+
+    def filterJournalsByFlag(self, df, column, value):
+        if df.empty:
+            return df
+
+        return df[df[column] == value].reset_index(drop=True)
+
+    def filterJournalsWithoutAPC(self, df):
+        return self.filterJournalsByFlag(df, "apc", "No")
+
+    def filterJournalsByText(self, df, field, term):
+        if df.empty:
+            return df
+
+        term = foldText(term)
+        mask = [term in foldText(value) for value in df[field].tolist()]
+
+        return df[mask].reset_index(drop=True)
+
+    @cached
+    def getJournalsWithLicense(self, licenses):
+        return self.run(self.getJournalsWithLicenseSteps(licenses))
+
+    def getJournalsWithLicenseSteps(self, licenses):
+        # An empty licence set selects every journal, which the store answers without the bitmaps
+        issns = (yield from self.matchJournalsSteps(anyOf=self.buildLicenceKeys(licenses))) if licenses else None
+        merged_df = yield from self.fetchJournalsSteps(issns, lambda query: query.getJournalsWithLicense(licenses))
+
+        return (yield from self.buildJournalsSteps(self.filterJournalsByLicense(merged_df, licenses)))
 
+    @cached
+    def getJournalsWithAPC(self):
+        return self.run(self.getJournalsWithFlagSteps("apc", lambda query: query.getJournalsWithAPC()))
+
+    @cached
     def getJournalsWithDOAJSeal(self):
-        all_dfs = [query.getJournalsWithDOAJSeal() for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+        return self.run(self.getJournalsWithFlagSteps("seal", lambda query: query.getJournalsWithDOAJSeal()))
 
-        journals = []
-        for index, row in merged_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+    def getJournalsWithFlagSteps(self, column, fallback):
+        issns = yield from self.matchJournalsSteps(allOf=[(column, "Yes")])
+        merged_df = yield from self.fetchJournalsSteps(issns, fallback)
 
-        return journals
+        return (yield from self.buildJournalsSteps(self.filterJournalsByFlag(merged_df, column, "Yes")))
 
+    @cached
     def getAllCategories(self):
-        all_dfs = [query.getAllCategories() for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+        return self.run(self.getCategoriesSteps(lambda query: query.getAllCategories()))
 
-        categories = []
-        for index, row in merged_df.iterrows():
-            category = Category(row["name"], row["quartile"])
-            categories.append(category)
+    @cached
+    def getAllAreas(self):
+        return self.run(self.getAreasSteps(lambda query: query.getAllAreas()))
 
-        return categories
+    @cached
+    def getCategoriesWithQuartile(self, quartiles):
+        return self.run(self.getCategoriesSteps(lambda query: query.getCategoriesWithQuartile(quartiles)))
 
-    def getAllAreas(self):
-        all_dfs = [query.getAllAreas() for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    @cached
+    def getCategoriesAssignedToAreas(self, area_ids):
+        return self.run(self.getCategoriesSteps(lambda query: query.getCategoriesAssignedToAreas(area_ids)))
 
-        areas = []
-        for index, row in merged_df.iterrows():
-            area = Area(row["name"])
-            areas.append(area)
+    @cached
+    def getAreasAssignedToCategories(self, category_ids):
+        return self.run(self.getAreasSteps(lambda query: query.getAreasAssignedToCategories(category_ids)))
 
-        return areas
+    def getCategoriesSteps(self, call):
+        merged_df = yield "collect", self.categoryQuery, call
 
-    def getCategoriesWithQuartile(self, quartiles):
-        all_dfs = [query.getCategoriesWithQuartile(quartiles) for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+        return self.buildCategories(merged_df)
 
-        categories = []
-        for index, row in merged_df.iterrows():
-            category = Category(row["name"], row["quartile"])
-            categories.append(category)
+    def getAreasSteps(self, call):
+        merged_df = yield "collect", self.categoryQuery, call
 
-        return categories
+        return self.buildAreas(merged_df)
 
-    def getCategoriesAssignedToAreas(self, area_ids):
-        all_dfs = [query.getCategoriesAssignedToAreas(area_ids) for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def buildJournals(self, df):
+        return self.run(self.buildJournalsSteps(df))
 
-        categories = []
-        for index, row in merged_df.iterrows():
-            category = Category(row["name"], row["quartile"])
-            categories.append(category)
+    def buildJournalSteps(self, row):
+        journals = yield from self.buildJournalsSteps(pd.DataFrame([row]))
 
-        return categories
+        return journals[0]
 
-    def getAreasAssignedToCategories(self, category_ids):
-        all_dfs = [query.getAreasAssignedToCategories(category_ids) for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def buildJournalsSteps(self, df):
+        if df.empty:
+            return []
 
-        areas = []
-        for index, row in merged_df.iterrows():
-            area = Area(row["name"])
-            areas.append(area)
+        issns = set(self.indexJournalsByIssn(df).index)
+        categories, areas = yield "both", self.getCategoriesByIssnSteps(issns), self.getAreasByIssnSteps(issns)
 
-        return areas
+        return self.assembleJournals(df, categories, areas)
+
+    def assembleJournals(self, df, categories, areas):
+        identifiers = [[item for item in ids if item] for ids in df["identifier"].fillna("").str.split(",")]
+        seals = (df["seal"] == "Yes").tolist()
+        apcs = (df["apc"] == "Yes").tolist()
 
-    def buildJournal(self, row):
-        ids = [item for item in row["identifier"].split(",") if item]
-        title = row["title"]
-        languages = [item for item in row["languages"].split(", ") if item]
-        publisher = row["publisher"]
-        seal = row["seal"] == "Yes"
-        licence = row["licence"]
-        apc = row["apc"] == "Yes"
+        # Journals with the same languages, categories or areas share one immutable tuple
+        languages = {}
+        shared_languages = {}
+        shared_categories = {}
+        shared_areas = {}
+        for langs in df["languages"].fillna("").unique():
+            key = tuple(sys.intern(item) for item in langs.split(", ") if item)
+            languages[langs] = shared_languages.setdefault(key, key)
 
-        categories = self.getJournalCategories(set(ids))
-        areas = self.getJournalAreas(set(ids))
+        journals = []
+        columns = zip(identifiers, df["title"].tolist(), df["languages"].fillna("").tolist(),
+                      df["publisher"].tolist(), seals, df["licence"].tolist(), apcs)
+        for ids, title, langs, publisher, seal, licence, apc in columns:
+            category_keys = tuple(dict.fromkeys(key for id in ids for key in categories.get(id, ())))
+            if category_keys not in shared_categories:
+                shared_categories[category_keys] = tuple(Category.intern(*key) for key in category_keys)
+
+            area_keys = tuple(dict.fromkeys(key for id in ids for key in areas.get(id, ())))
+            if area_keys not in shared_areas:
+                shared_areas[area_keys] = tuple(Area.intern(name) for name in area_keys)
+
+            if isinstance(publisher, str):
+                publisher = sys.intern(publisher)
+            if isinstance(licence, str):
+                licence = sys.intern(licence)
+
+            journal = Journal(ids, title, languages[langs], publisher, seal, licence, apc,
+                              shared_categories[category_keys], shared_areas[area_keys])
+            journals.append(journal)
+
+        return journals
+
+    def buildCategories(self, df):
+        if df.empty:
+            return []
+
+        quartiles = df["quartile"].astype(object).where(df["quartile"].notna(), None)
 
-        return Journal(ids, title, languages, publisher, seal, licence, apc, categories, areas)
+        return [Category.intern(name, quartile) for name, quartile in zip(df["name"].tolist(), quartiles.tolist())]
 
-    def getJournalCategories(self, journal_ids):
-        all_dfs = [query.getJournalCategories(journal_ids) for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def buildAreas(self, df):
+        if df.empty:
+            return []
 
-        categories = []
-        for index, row in merged_df.iterrows():
-            category = Category(row["name"], row["quartile"])
-            categories.append(category)
+        return [Area.intern(name) for name in df["name"].tolist()]
+
+    def getCategoriesByIssnSteps(self, journal_ids):
+        merged_df = yield "collect", self.categoryQuery, lambda query: query.getCategoriesOfJournals(journal_ids)
+
+        return self.indexCategoriesByIssn(merged_df)
+
+    def indexCategoriesByIssn(self, merged_df):
+        categories = {}
+        if merged_df.empty:
+            return categories
+
+        quartiles = merged_df["quartile"].astype(object).where(merged_df["quartile"].notna(), None)
+        keys = list(zip(merged_df["name"].tolist(), quartiles.tolist()))
+        for column in ("identifier_1", "identifier_2"):
+            for id, key in zip(merged_df[column].tolist(), keys):
+                if isinstance(id, str) and id:
+                    categories.setdefault(id, []).append(key)
 
         return categories
 
-    def getJournalAreas(self, journal_ids):
-        all_dfs = [query.getJournalAreas(journal_ids) for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def getAreasByIssnSteps(self, journal_ids):
+        merged_df = yield "collect", self.categoryQuery, lambda query: query.getAreasOfJournals(journal_ids)
+
+        return self.indexAreasByIssn(merged_df)
 
-        areas = []
-        for index, row in merged_df.iterrows():
-            area = Area(row["name"])
-            areas.append(area)
+    def indexAreasByIssn(self, merged_df):
+        areas = {}
+        if merged_df.empty:
+            return areas
+
+        names = merged_df["name"].tolist()
+        for column in ("identifier_1", "identifier_2"):
+            for id, name in zip(merged_df[column].tolist(), names):
+                if isinstance(id, str) and id:
+                    areas.setdefault(id, []).append(name)
 
         return areas
 
+    def indexJournalsByIssn(self, df):
+        issns = df["identifier"].fillna("").str.split(",").explode()
+        issns = issns[issns != ""]
+
+        return pd.Series(issns.index, index=issns.values)
+
     def filterJournalsByIds(self, df, ids):
-        merged_df = pd.DataFrame()
-        for couple in ids:
-            for id in couple:
-                if id is None:
-                    continue
-                new_df = df[df["identifier"].str.contains(id, na=False)]
-                merged_df = pd.concat([merged_df, new_df]).drop_duplicates().reset_index(drop=True)
-                if not new_df.empty:
-                    break
+        if df.empty or ids.empty:
+            return pd.DataFrame()
+
+        wanted = pd.concat([ids["identifier_1"], ids["identifier_2"]]).dropna().unique()
+
+        index = self.indexJournalsByIssn(df)
+        rows = index[index.index.isin(wanted)].unique()
 
-        return merged_df
+        return df[df.index.isin(rows)].reset_index(drop=True)
 
 class FullQueryEngine(BasicQueryEngine):
+    PUSHDOWN_LIMIT = 1000
+
+    @cached
     def getJournalsInCategoriesWithQuartile(self, category_ids, quartiles):
-        all_dfs = [query.getJournalsByCategoryWithQuartile(category_ids, quartiles) for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+        return self.run(self.getJournalsInCategoriesWithQuartileSteps(category_ids, quartiles))
+
+    def getJournalsInCategoriesWithQuartileSteps(self, category_ids, quartiles):
+        method = "getJournalsInCategoriesWithQuartile"
+        graph = lambda query: query.getAllJournals()
+        plan, identifiers, graph_df = yield from self.planMashupSteps(method, (category_ids, quartiles), graph)
+
+        return (yield from self.runMashupSteps(
+            plan,
+            identifiers,
+            graph_df,
+            graph,
+            lambda df: df,
+        ))
+
+    @cached
+    def getJournalsInAreasWithLicense(self, areas_ids, licenses):
+        return self.run(self.getJournalsInAreasWithLicenseSteps(areas_ids, licenses))
+
+    def getJournalsInAreasWithLicenseSteps(self, areas_ids, licenses):
+        method = "getJournalsInAreasWithLicense"
+        graph = lambda query: query.getJournalsWithLicense(licenses)
+        plan, identifiers, graph_df = yield from self.planMashupSteps(method, (areas_ids, licenses), graph)
+
+        return (yield from self.runMashupSteps(
+            plan,
+            identifiers,
+            graph_df,
+            graph,
+            lambda df: self.filterJournalsByLicense(df, licenses),
+            self.buildFlags(method, areas_ids, licenses),
+        ))
+
+    @cached
+    def getDiamondJournalsInAreasAndCategoriesWithQuartile(self, areas_ids, category_ids, quartiles):
+        return self.run(self.getDiamondJournalsSteps(areas_ids, category_ids, quartiles))
+
+    def getDiamondJournalsSteps(self, areas_ids, category_ids, quartiles):
+        method = "getDiamondJournalsInAreasAndCategoriesWithQuartile"
+        graph = lambda query: query.getJournalsWithoutAPC()
+        plan, identifiers, graph_df = yield from self.planMashupSteps(method, (areas_ids, category_ids, quartiles),
+                                                                      graph)
+
+        return (yield from self.runMashupSteps(
+            plan,
+            identifiers,
+            graph_df,
+            graph,
+            self.filterJournalsWithoutAPC,
+            self.buildFlags(method, areas_ids, category_ids, quartiles),
+        ))
+
+    def explain(self, method, *args):
+        return self.run(self.explainSteps(method, *args))
+
+    def explainSteps(self, method, *args):
+        plan, identifiers, graph_df = yield from self.planMashupSteps(method, args)
+
+        return plan
+
+    def planMashupSteps(self, method, args, graph=None):
+        probes = self.buildProbes(method, *args)
+        if probes is None:
+            return None, None, None
+
+        # The relational side is fetched rather than counted, so the join reuses the rows of its estimate.
+        # With indexes enabled the graph side is counted from the bitmaps, without a query per call.
+        relational, count, flags = probes
+        identifiers, (count, graph_df) = yield (
+            "both",
+            self.collectSteps(self.categoryQuery, relational),
+            self.prefetchGraphSteps(count, graph, flags),
+        )
+
+        return self.choosePlan(method, len(identifiers), count), identifiers, graph_df
+
+    def prefetchGraphSteps(self, count, graph, flags):
+        count = yield from self.countMatchingJournalsSteps(count, **flags)
+
+        # A graph side within the pushdown limit is fetched whole, alongside the relational rows
+        if graph is None or not count or count > self.PUSHDOWN_LIMIT:
+            return count, None
+
+        return count, (yield "collect", self.journalQuery, graph)
+
+    def buildProbes(self, method, *args):
+        if method == "getJournalsInCategoriesWithQuartile":
+            relational = lambda query: query.getJournalsByCategoryWithQuartile(*args)
+            graph = lambda query: query.countAllJournals()
+        elif method == "getJournalsInAreasWithLicense":
+            areas_ids, licenses = args
+            relational = lambda query: query.getJournalsByArea(areas_ids)
+            graph = lambda query: query.countJournalsWithLicense(licenses)
+        elif method == "getDiamondJournalsInAreasAndCategoriesWithQuartile":
+            relational = lambda query: query.getJournalsByAreaAndCategoryWithQuartile(*args)
+            graph = lambda query: query.countJournalsWithoutAPC()
+        else:
+            return None
+
+        return relational, graph, self.buildFlags(method, *args)
 
-        identifiers = merged_df.values.tolist()
+    def buildFlags(self, method, *args):
+        if method == "getJournalsInAreasWithLicense":
+            return {"anyOf": self.buildLicenceKeys(args[1])}
+        if method == "getDiamondJournalsInAreasAndCategoriesWithQuartile":
+            return {"allOf": [("apc", "No")]}
 
-        all_dfs = [query.getAllJournals() for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+        return {}
+
+    def choosePlan(self, method, relational, graph):
+        # A small graph side is already fetched by the time the relational rows are in, so only a larger one
+        # is worth pushing ISSNs into, each relational row carrying up to two of them
+        if not relational or not graph:
+            join = "empty"
+        elif graph > self.PUSHDOWN_LIMIT and relational * 2 <= self.PUSHDOWN_LIMIT:
+            join = "pushdown"
+        else:
+            join = "memory"
+
+        return {
+            "method": method,
+            "estimates": {"relational": relational, "graph": graph},
+            "join": join,
+        }
+
+    def runMashupSteps(self, plan, identifiers, graph_df, graph, predicate, flags={}):
+        if plan["join"] == "empty":
+            return []
+
+        if plan["join"] == "pushdown":
+            merged_df = predicate((yield from self.getJournalsByIdsSteps(identifiers, flags)))
+        elif graph_df is not None:
+            merged_df = graph_df
+        else:
+            merged_df = yield "collect", self.journalQuery, graph
 
         filtered_df = self.filterJournalsByIds(merged_df, identifiers)
 
-        journals = []
-        for index, row in filtered_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+        return (yield from self.buildJournalsSteps(filtered_df))
+
+    def getJournalsByIdsSteps(self, ids, flags={}):
+        issns = pd.concat([ids["identifier_1"], ids["identifier_2"]]).dropna().unique().tolist()
+        if flags:
+            # ISSNs of journals the bitmaps already rule out are never sent to the graph store
+            matches = yield from self.matchJournalsSteps(**flags)
+            if matches is not None:
+                issns = sorted(set(issns).intersection(matches))
+
+        return (yield "collect", self.journalQuery, lambda query: query.getJournalsByIds(issns))
+
+class AsyncFullQueryEngine(FullQueryEngine):
+    def __init__(self, timeout=None, snapshotPath=""):
+        super().__init__(workers=1, timeout=timeout, snapshotPath=snapshotPath)
+
+    async def run(self, steps):
+        result = None
+        while True:
+            try:
+                request = steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            result = await self.perform(*request)
+
+    async def perform(self, kind, *args):
+        if kind == "collect":
+            return await self.collectResults(*args)
+        if kind == "map":
+            return await self.mapHandlers(*args)
+        if kind == "next":
+            return await anext(args[0], None)
+
+        first, second = args
+        return tuple(await asyncio.gather(self.run(first), self.run(second)))
+
+    async def mapHandlers(self, handlers, call):
+        async def callHandler(handler):
+            result = call(handler)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+
+        if self.timeout is None or not handlers:
+            return list(await asyncio.gather(*(callHandler(handler) for handler in handlers)))
+
+        tasks = [asyncio.ensure_future(callHandler(handler)) for handler in handlers]
+        done, pending = await asyncio.wait(tasks, timeout=self.timeout)
+        for task in pending:
+            # A handler that does not answer in time is left out of the merged result
+            task.cancel()
+
+        return [task.result() for task in tasks if task in done]
+
+    async def collectResults(self, handlers, call):
+        all_dfs = [df for df in await self.mapHandlers(handlers, call) if df is not None]
+        return pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+
+    @cached
+    async def getEntityById(self, id):
+        return await self.run(self.getEntityByIdSteps(id))
+
+    @cached
+    async def getEntitiesByIds(self, ids):
+        return await self.run(self.getEntitiesByIdsSteps(ids))
+
+    @cached
+    async def getAllJournals(self):
+        return await self.run(self.getAllJournalsSteps())
+
+    async def iterAllJournals(self, batchSize=1000):
+        pages = []
+        for query in self.journalQuery:
+            stream = query.iterJournalPages(batchSize)
+            pages.append(stream if hasattr(stream, "__aiter__") else self.iterPages(stream))
+        steps = self.iterAllJournalsSteps(pages, batchSize)
+
+        result = None
+        while True:
+            try:
+                request = steps.send(result)
+            except StopIteration:
+                return
+            if request[0] == "emit":
+                result = None
+                yield request[1]
+            else:
+                result = await self.perform(*request)
+
+    async def iterPages(self, pages):
+        for page_df in pages:
+            yield page_df
+
+    @cached
+    async def getJournalsWithTitle(self, partialTitle):
+        return await self.run(self.searchJournalsSteps("title", partialTitle,
+                                                       lambda query: query.getJournalsWithTitle(partialTitle)))
+
+    @cached
+    async def getJournalsPublishedBy(self, partialName):
+        return await self.run(self.searchJournalsSteps("publisher", partialName,
+                                                       lambda query: query.getJournalsPublishedBy(partialName)))
+
+    @cached
+    async def getJournalsWithLicense(self, licenses):
+        return await self.run(self.getJournalsWithLicenseSteps(licenses))
+
+    @cached
+    async def getJournalsWithAPC(self):
+        return await self.run(self.getJournalsWithFlagSteps("apc", lambda query: query.getJournalsWithAPC()))
+
+    @cached
+    async def getJournalsWithDOAJSeal(self):
+        return await self.run(self.getJournalsWithFlagSteps("seal", lambda query: query.getJournalsWithDOAJSeal()))
+
+    @cached
+    async def getAllCategories(self):
+        return await self.run(self.getCategoriesSteps(lambda query: query.getAllCategories()))
+
+    @cached
+    async def getAllAreas(self):
+        return await self.run(self.getAreasSteps(lambda query: query.getAllAreas()))
+
+    @cached
+    async def getCategoriesWithQuartile(self, quartiles):
+        return await self.run(self.getCategoriesSteps(lambda query: query.getCategoriesWithQuartile(quartiles)))
+
+    @cached
+    async def getCategoriesAssignedToAreas(self, area_ids):
+        return await self.run(self.getCategoriesSteps(lambda query: query.getCategoriesAssignedToAreas(area_ids)))
+
+    @cached
+    async def getAreasAssignedToCategories(self, category_ids):
+        return await self.run(self.getAreasSteps(lambda query: query.getAreasAssignedToCategories(category_ids)))
+
+    @cached
+    async def getJournalsInCategoriesWithQuartile(self, category_ids, quartiles):
+        return await self.run(self.getJournalsInCategoriesWithQuartileSteps(category_ids, quartiles))
+
+    @cached
+    async def getJournalsInAreasWithLicense(self, areas_ids, licenses):
+        return await self.run(self.getJournalsInAreasWithLicenseSteps(areas_ids, licenses))
+
+    @cached
+    async def getDiamondJournalsInAreasAndCategoriesWithQuartile(self, areas_ids, category_ids, quartiles):
+        return await self.run(self.getDiamondJournalsSteps(areas_ids, category_ids, quartiles))
+
+    async def explain(self, method, *args):
+        return await self.run(self.explainSteps(method, *args))
+
+    async def buildJournals(self, df):
+        return await self.run(self.buildJournalsSteps(df))
+
+class SnapshotQueryEngine(FullQueryEngine):
+    def __init__(self, workers=4, timeout=None, snapshotPath=""):
+        super().__init__(workers, timeout, snapshotPath)
+        self.snapshot = None
+        self.snapshotLock = threading.Lock()
+
+    def setSnapshotPath(self, snapshotPath):
+        if super().setSnapshotPath(snapshotPath):
+            self.snapshot = None
+            return True
+        else:
+            return False
 
-        return journals
+    def saveSnapshot(self, snapshotPath):
+        return self.getSnapshot().save(snapshotPath)
 
-    def getJournalsInAreasWithLicense(self, areas_ids, licenses):
-        all_dfs = [query.getJournalsByArea(areas_ids) for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def cleanJournalHandlers(self):
+        self.snapshot = None
+        return super().cleanJournalHandlers()
 
-        identifiers = merged_df.values.tolist()
+    def cleanCategoryHandlers(self):
+        self.snapshot = None
+        return super().cleanCategoryHandlers()
 
-        all_dfs = [query.getJournalsWithLicense(licenses) for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def addJournalHandler(self, handler):
+        self.snapshot = None
+        return super().addJournalHandler(handler)
 
-        filtered_df = self.filterJournalsByIds(merged_df, identifiers)
+    def addCategoryHandler(self, handler):
+        self.snapshot = None
+        return super().addCategoryHandler(handler)
+
+    def refresh(self):
+        snapshot = self.loadSnapshot()
+        with self.snapshotLock:
+            self.snapshot = snapshot
+        if self.cache is not None:
+            self.cache.clear()
+        return True
 
-        journals = []
-        for index, row in filtered_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+    def getSnapshot(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            with self.snapshotLock:
+                if self.snapshot is None:
+                    self.snapshot = self.loadSnapshot()
+                snapshot = self.snapshot
+
+        return snapshot
+
+    def loadSnapshot(self):
+        # A snapshot on disk is mapped rather than read, so worker processes share its pages
+        if self.snapshotPath:
+            snapshot = Snapshot.open(self.snapshotPath)
+            if snapshot is not None:
+                return snapshot
+
+        journals_df, relational = self.runBoth(
+            lambda: self.collectResults(self.journalQuery, lambda query: query.getAllJournals()),
+            lambda: [
+                self.collectResults(self.categoryQuery, lambda query: query.getAllJournalIdentifiers()),
+                self.collectResults(self.categoryQuery, lambda query: query.getAllCategories()),
+                self.collectResults(self.categoryQuery, lambda query: query.getAllAreas()),
+                self.collectResults(self.categoryQuery, lambda query: query.getAllJournalCategories()),
+                self.collectResults(self.categoryQuery, lambda query: query.getAllJournalAreas()),
+                self.collectResults(self.categoryQuery, lambda query: query.getAllAreaCategories()),
+            ],
+        )
+
+        if journals_df.empty:
+            columns = ["title", "identifier", "languages", "publisher", "seal", "licence", "apc"]
+            journals_df = pd.DataFrame(columns=columns)
+
+        return Snapshot.fromFrames(journals_df, *relational)
+
+    @cached
+    def getEntityById(self, id):
+        snapshot = self.getSnapshot()
+        entry = snapshot.lookup(id)
+        if entry is None:
+            return None
+
+        kind, code = entry
+        if kind == "journal":
+            return snapshot.buildJournals([code])[0]
+        if kind == "relational":
+            return snapshot.buildRelationalJournal(code)
+        if kind == "area":
+            return snapshot.buildAreas([code])[0]
+        return snapshot.buildCategories([code])[0]
+
+    @cached
+    def getEntitiesByIds(self, ids):
+        ids = list(dict.fromkeys(ids))
+        snapshot = self.getSnapshot()
+
+        entries = {id: snapshot.lookup(id) for id in ids}
+        journal_ids = [id for id in ids if entries[id] is not None and entries[id][0] == "journal"]
+        journals = dict(zip(journal_ids, snapshot.buildJournals([entries[id][1] for id in journal_ids])))
+
+        entities = {}
+        for id in ids:
+            if id in journals:
+                entities[id] = journals[id]
+            elif entries[id] is None:
+                entities[id] = None
+            else:
+                entities[id] = self.getEntityById(id)
 
-        return journals
+        return entities
 
-    def getDiamondJournalsInAreasAndCategoriesWithQuartile(self, areas_ids, category_ids, quartiles):
-        all_dfs = [query.getJournalsByAreaAndCategoryWithQuartile(areas_ids, category_ids, quartiles) for query in self.categoryQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    @cached
+    def getAllJournals(self):
+        snapshot = self.getSnapshot()
 
-        identifiers = merged_df.values.tolist()
+        return snapshot.buildJournals(range(snapshot.getJournalCount()))
 
-        all_dfs = [query.getJournalsWithoutAPC() for query in self.journalQuery]
-        merged_df = pd.concat(all_dfs).drop_duplicates().reset_index(drop=True) if all_dfs else pd.DataFrame()
+    def iterAllJournals(self, batchSize=1000):
+        snapshot = self.getSnapshot()
+        for start in range(0, snapshot.getJournalCount(), batchSize):
+            yield snapshot.buildJournals(range(start, min(start + batchSize, snapshot.getJournalCount())))
 
-        filtered_df = self.filterJournalsByIds(merged_df, identifiers)
+    @cached
+    def getJournalsWithTitle(self, partialTitle):
+        snapshot = self.getSnapshot()
 
-        journals = []
-        for index, row in filtered_df.iterrows():
-            journal = self.buildJournal(row)
-            journals.append(journal)
+        return self.buildSnapshotJournals(snapshot, snapshot.getTitleMask(partialTitle))
 
-        return journals
+    @cached
+    def getJournalsPublishedBy(self, partialName):
+        snapshot = self.getSnapshot()
+
+        return self.buildSnapshotJournals(snapshot, snapshot.getPublisherMask(partialName))
+
+    @cached
+    def getJournalsWithLicense(self, licenses):
+        snapshot = self.getSnapshot()
+
+        return self.buildSnapshotJournals(snapshot, snapshot.getLicenceMask(licenses))
+
+    @cached
+    def getJournalsWithAPC(self):
+        snapshot = self.getSnapshot()
+
+        return self.buildSnapshotJournals(snapshot, snapshot.getAPCMask())
+
+    @cached
+    def getJournalsWithDOAJSeal(self):
+        snapshot = self.getSnapshot()
+
+        return self.buildSnapshotJournals(snapshot, snapshot.getSealMask())
+
+    @cached
+    def getAllCategories(self):
+        snapshot = self.getSnapshot()
+
+        return snapshot.buildCategories(np.flatnonzero(snapshot.getCategoryMask()))
+
+    @cached
+    def getAllAreas(self):
+        snapshot = self.getSnapshot()
+
+        return snapshot.buildAreas(np.flatnonzero(snapshot.getAreaMask()))
+
+    @cached
+    def getCategoriesWithQuartile(self, quartiles):
+        snapshot = self.getSnapshot()
+        mask = snapshot.getCategoryMask(quartiles=set(quartiles) if quartiles else None)
+
+        return snapshot.buildCategories(np.flatnonzero(mask))
+
+    @cached
+    def getCategoriesAssignedToAreas(self, area_ids):
+        snapshot = self.getSnapshot()
+        areas, categories = snapshot.getAreaCategoryPairs()
+        area_mask = snapshot.getAreaMask(set(area_ids) if area_ids else None)
+
+        return snapshot.buildCategories(np.unique(categories[area_mask[areas]]))
+
+    @cached
+    def getAreasAssignedToCategories(self, category_ids):
+        snapshot = self.getSnapshot()
+        areas, categories = snapshot.getAreaCategoryPairs()
+        category_mask = snapshot.getCategoryMask(set(category_ids) if category_ids else None)
+
+        return snapshot.buildAreas(np.unique(areas[category_mask[categories]]))
+
+    @cached
+    def getJournalsInCategoriesWithQuartile(self, category_ids, quartiles):
+        snapshot = self.getSnapshot()
+        relational_mask = self.getRelationalMask(snapshot, category_ids=category_ids, quartiles=quartiles)
+
+        return self.buildSnapshotJournals(snapshot, snapshot.getJournalsOfRelational(relational_mask))
+
+    @cached
+    def getJournalsInAreasWithLicense(self, areas_ids, licenses):
+        snapshot = self.getSnapshot()
+        relational_mask = self.getRelationalMask(snapshot, areas_ids=areas_ids)
+        mask = snapshot.getJournalsOfRelational(relational_mask) & snapshot.getLicenceMask(licenses)
+
+        return self.buildSnapshotJournals(snapshot, mask)
+
+    @cached
+    def getDiamondJournalsInAreasAndCategoriesWithQuartile(self, areas_ids, category_ids, quartiles):
+        snapshot = self.getSnapshot()
+        if areas_ids and category_ids and quartiles:
+            relational_mask = (self.getRelationalMask(snapshot, areas_ids=areas_ids)
+                               & self.getRelationalMask(snapshot, category_ids=category_ids, quartiles=quartiles))
+        else:
+            relational_mask = self.getRelationalMask(snapshot)
+        mask = snapshot.getJournalsOfRelational(relational_mask) & ~snapshot.getAPCMask()
+
+        return self.buildSnapshotJournals(snapshot, mask)
+
+    def getRelationalMask(self, snapshot, areas_ids=None, category_ids=None, quartiles=None):
+        # As in the SQL queries, an empty filter selects every journal of the relational store
+        if areas_ids:
+            return snapshot.getRelationalWithAreas(snapshot.getAreaMask(set(areas_ids)))
+        if category_ids and quartiles:
+            quartiles = {quartile for quartile in quartiles if quartile is not None}
+            return snapshot.getRelationalWithCategories(snapshot.getCategoryMask(set(category_ids), quartiles))
+
+        return np.ones(snapshot.getRelationalCount(), dtype=bool)
+
+    def buildSnapshotJournals(self, snapshot, mask):
+        return snapshot.buildJournals(np.flatnonzero(mask))
@@ -1,9 +1,40 @@
+import asyncio
 import json
 import sqlite3
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial, wraps
+from pathlib import Path
 import pandas as pd
-from rdflib import Graph, URIRef, Literal, RDF
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from rdflib import RDF
 from rdflib.plugins.stores.sparqlstore import SPARQLUpdateStore
-from sparql_dataframe import get
+from SPARQLWrapper import SPARQLWrapper, JSON, POST
+from impl.caches import ResultCache, cached, invalidateCaches, watchLocation
+from impl.snapshots import Snapshot
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+NT_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r"})
+
+def runsInExecutor(method):
+    @wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.getExecutor(), partial(method, self, *args, **kwargs))
+
+    return wrapper
 
 class Handler:
     def __init__(self):
@@ -20,64 +51,362 @@ class Handler:
             return False
 
 class UploadHandler(Handler):
-    def __init__(self):
+    def __init__(self, upsert=False):
         super().__init__()
+        self.upsert = upsert
+        self.stats = {}
+        self.snapshotPath = ""
+
+    def getStats(self):
+        return self.stats
+
+    def getSnapshotPath(self):
+        return self.snapshotPath
+
+    def setSnapshotPath(self, snapshotPath):
+        if isinstance(snapshotPath, str):
+            self.snapshotPath = snapshotPath
+            return True
+        else:
+            return False
 
     def pushDataToDb(self, path):
         pass # Implemented in subclasses
 
+    def emitSnapshot(self):
+        pass # Implemented in subclasses
+
 class JournalUploadHandler(UploadHandler):
-    def __init__(self):
-        super().__init__()
+    BASE_URL = "https://github.com/metamuses/bifrost/"
+
+    JOURNAL = "https://schema.org/Periodical"
+
+    PREDICATES = {
+        "Journal title": "https://schema.org/name",
+        "issn and eissn": "https://schema.org/identifier",
+        "Languages in which the journal accepts manuscripts": "https://schema.org/inLanguage",
+        "Publisher": "https://schema.org/publisher",
+        "DOAJ Seal": "https://www.wikidata.org/wiki/Q73548471",
+        "Journal license": "https://schema.org/license",
+        "APC": "https://www.wikidata.org/wiki/Q15291071",
+    }
+
+    ISSN = "https://schema.org/issn"
+    ISSN_COLUMNS = ("Journal ISSN (print version)", "Journal EISSN (online version)")
+
+    LICENCE = "https://www.wikidata.org/wiki/Property:P275"
+
+    SOURCE_COLUMNS = {
+        "title": "Journal title",
+        "identifier": "issn and eissn",
+        "languages": "Languages in which the journal accepts manuscripts",
+        "publisher": "Publisher",
+        "seal": "DOAJ Seal",
+        "licence": "Journal license",
+        "apc": "APC",
+    }
+
+    def __init__(self, batchSize=2000, workers=1, progress=None, upsert=False):
+        super().__init__(upsert)
+        self.batchSize = batchSize
+        self.workers = workers
+        self.progress = progress
 
     def pushDataToDb(self, path):
         if not self.getDbPathOrUrl():
             return False
 
-        base_url = "https://github.com/metamuses/bifrost/"
+        endpoint = self.getDbPathOrUrl()
+        self.stats = {"rows": 0, "inserted": 0, "deleted": 0, "unchanged": 0, "batches": 0,
+                      "peakMemory": self.getPeakMemory()}
+
+        post = self.upsertTriples if self.upsert else self.postTriples
+        chunks = pd.read_csv(path, keep_default_na=False, dtype=str, chunksize=self.batchSize)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = {}
+            for chunk in chunks:
+                if self.getSnapshotPath():
+                    self.saveSourceChunk(chunk)
+                lines = self.serializeChunk(chunk)
+                future = executor.submit(post, endpoint, lines)
+                pending[future] = len(chunk)
+
+                # Bound the number of serialized batches held in memory at once
+                if len(pending) >= self.workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    self.recordBatches(done, pending)
+
+            done, _ = wait(pending)
+            self.recordBatches(done, pending)
+
+        invalidateCaches(endpoint)
+        self.emitSnapshot()
+
+        return True
+
+    def saveSourceChunk(self, chunk):
+        # Each chunk is merged by subject over the rows already saved, so no more than one is held at a time
+        source_df = self.buildSourceFrame(chunk)
+        return Snapshot.saveSources(self.getSnapshotPath(), "graph", [source_df], key="subject", rebuild=False)
+
+    def emitSnapshot(self):
+        if not self.getSnapshotPath():
+            return False
+
+        return Snapshot.compileSources(self.getSnapshotPath())
 
-        Journal = URIRef("https://schema.org/Periodical")
+    def buildSourceFrame(self, df):
+        df = df.copy()
+        df["issn and eissn"] = df["Journal ISSN (print version)"] + "," + df["Journal EISSN (online version)"]
 
-        title = URIRef("https://schema.org/name")
-        identifier = URIRef("https://schema.org/identifier")
-        language = URIRef("https://schema.org/inLanguage")
-        publisher = URIRef("https://schema.org/publisher")
-        seal = URIRef("https://www.wikidata.org/wiki/Q73548471")
-        license = URIRef("https://schema.org/license")
-        apc = URIRef("https://www.wikidata.org/wiki/Q15291071")
+        source_df = pd.DataFrame({column: df[name] for column, name in self.SOURCE_COLUMNS.items()})
+        source_df["subject"] = self.getSubjectKeys(df)
 
-        graph = Graph()
+        return source_df
 
-        df = pd.read_csv(path, keep_default_na=False)
+    def serializeChunk(self, df):
+        df = df.copy()
         df["issn and eissn"] = df["Journal ISSN (print version)"] + "," + df["Journal EISSN (online version)"]
 
-        for idx, row in df.iterrows():
-            local_id = "journal-" + str(idx)
-            subj = URIRef(base_url + local_id)
+        subjects = "<" + self.BASE_URL + "journal-" + self.getSubjectKeys(df) + ">"
 
-            graph.add((subj, RDF.type, Journal))
-            graph.add((subj, title, Literal(row["Journal title"])))
-            graph.add((subj, identifier, Literal (row["issn and eissn"])))
-            graph.add((subj, language, Literal (row["Languages in which the journal accepts manuscripts"])))
-            graph.add((subj, publisher, Literal(row["Publisher"])))
-            graph.add((subj, seal, Literal(row["DOAJ Seal"])))
-            graph.add((subj, license, Literal (row["Journal license"])))
-            graph.add((subj, apc, Literal(row["APC"])))
+        lines = (subjects + f" <{RDF.type}> <{self.JOURNAL}> .").tolist()
+        for column, predicate in self.PREDICATES.items():
+            objects = self.escapeLiterals(df[column])
+            lines.extend((subjects + f' <{predicate}> "' + objects + '" .').tolist())
 
-        store = SPARQLUpdateStore()
-        endpoint = self.getDbPathOrUrl()
+        # Each ISSN also gets its own triple so lookups can match it exactly
+        for column in self.ISSN_COLUMNS:
+            present = df[column] != ""
+            objects = self.escapeLiterals(df.loc[present, column])
+            lines.extend((subjects[present] + f' <{self.ISSN}> "' + objects + '" .').tolist())
+
+        # Likewise each licence in the comma separated list gets its own triple
+        licences = df["Journal license"].str.split(", ").explode()
+        licences = licences[licences.notna() & (licences != "")]
+        objects = self.escapeLiterals(licences)
+        lines.extend((subjects.loc[licences.index] + f' <{self.LICENCE}> "' + objects + '" .').tolist())
+
+        return lines
+
+    def getSubjectKeys(self, df):
+        # Subjects are keyed by ISSN so that re-uploading a journal always targets the same IRI
+        issn = df["Journal ISSN (print version)"]
+        eissn = df["Journal EISSN (online version)"]
+        keys = issn.where(issn != "", eissn)
+        fallback = "row-" + pd.Series(df.index.astype(str), index=df.index)
+
+        return keys.where(keys != "", fallback)
+
+    def escapeLiterals(self, values):
+        return values.str.translate(NT_ESCAPES)
 
+    def postTriples(self, endpoint, lines):
+        self.updateTriples(endpoint, [], lines)
+
+        return {"inserted": len(lines)}
+
+    def upsertTriples(self, endpoint, lines):
+        desired = {}
+        for line in lines:
+            desired.setdefault(line[:line.index(" ")], set()).add(line)
+
+        stored = self.getStoredTriples(endpoint, list(desired))
+
+        inserts = []
+        deletes = []
+        unchanged = 0
+        for subject, triples in desired.items():
+            current = stored.get(subject, set())
+            if triples == current:
+                unchanged += 1
+            else:
+                inserts.extend(triples - current)
+                deletes.extend(current - triples)
+
+        if inserts or deletes:
+            self.updateTriples(endpoint, deletes, inserts)
+
+        return {"inserted": len(inserts), "deleted": len(deletes), "unchanged": unchanged}
+
+    def getStoredTriples(self, endpoint, subjects):
+        query = f"""
+            SELECT ?s ?p ?o
+            WHERE {{
+                VALUES ?s {{ {" ".join(subjects)} }}
+                ?s ?p ?o .
+            }}
+        """
+
+        sparql = SPARQLWrapper(endpoint)
+        sparql.setMethod(POST)
+        sparql.setQuery(query)
+        sparql.setReturnFormat(JSON)
+        bindings = sparql.query().convert()["results"]["bindings"]
+
+        stored = {}
+        for binding in bindings:
+            subject = f"<{binding['s']['value']}>"
+            obj = binding["o"]
+            if obj["type"] == "uri":
+                value = f"<{obj['value']}>"
+            else:
+                value = '"' + obj["value"].translate(NT_ESCAPES) + '"'
+            stored.setdefault(subject, set()).add(f"{subject} <{binding['p']['value']}> {value} .")
+
+        return stored
+
+    def updateTriples(self, endpoint, deletes, inserts):
+        operations = []
+        if deletes:
+            operations.append("DELETE DATA {\n" + "\n".join(deletes) + "\n}")
+        if inserts:
+            operations.append("INSERT DATA {\n" + "\n".join(inserts) + "\n}")
+
+        store = SPARQLUpdateStore()
         store.open((endpoint, endpoint))
-        data = graph.serialize(format="nt")
-        query = f"INSERT DATA {{\n{data}\n}}"
-        store.update(query)
+        store.update(" ;\n".join(operations))
         store.close()
 
-        return True
+    def recordBatches(self, done, pending):
+        for future in done:
+            counts = future.result()
+            self.stats["rows"] += pending.pop(future)
+            for key, value in counts.items():
+                self.stats[key] += value
+            self.stats["batches"] += 1
+            self.stats["peakMemory"] = self.getPeakMemory()
+
+            if self.progress:
+                self.progress(dict(self.stats))
+
+    def getPeakMemory(self):
+        if resource is None:
+            return None
+
+        # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
 
 class CategoryUploadHandler(UploadHandler):
-    def __init__(self):
-        super().__init__()
+    DROP_SCHEMA = """
+        DROP TABLE IF EXISTS issn_areas;
+        DROP TABLE IF EXISTS issn_categories;
+        DROP VIEW IF EXISTS journal_issns;
+        DROP TABLE IF EXISTS areas_categories;
+        DROP TABLE IF EXISTS journals_areas;
+        DROP TABLE IF EXISTS journals_categories;
+        DROP TABLE IF EXISTS areas;
+        DROP TABLE IF EXISTS categories;
+        DROP TABLE IF EXISTS journals;
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS journals (
+            id INTEGER PRIMARY KEY,
+            identifier_1 TEXT,
+            identifier_2 TEXT
+        );
+        CREATE INDEX IF NOT EXISTS journals_identifier_1 ON journals (identifier_1, identifier_2);
+        CREATE INDEX IF NOT EXISTS journals_identifier_2 ON journals (identifier_2, identifier_1);
+
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            quartile TEXT
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS categories_name_quartile ON categories (name, quartile);
+        CREATE INDEX IF NOT EXISTS categories_quartile ON categories (quartile);
+
+        CREATE TABLE IF NOT EXISTS areas (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+
+        CREATE TABLE IF NOT EXISTS journals_categories (
+            journal_id INTEGER NOT NULL REFERENCES journals (id),
+            category_id INTEGER NOT NULL REFERENCES categories (id),
+            PRIMARY KEY (journal_id, category_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS journals_categories_category ON journals_categories (category_id, journal_id);
+
+        CREATE TABLE IF NOT EXISTS journals_areas (
+            journal_id INTEGER NOT NULL REFERENCES journals (id),
+            area_id INTEGER NOT NULL REFERENCES areas (id),
+            PRIMARY KEY (journal_id, area_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS journals_areas_area ON journals_areas (area_id, journal_id);
+
+        CREATE TABLE IF NOT EXISTS areas_categories (
+            area_id INTEGER NOT NULL REFERENCES areas (id),
+            category_id INTEGER NOT NULL REFERENCES categories (id),
+            PRIMARY KEY (area_id, category_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS areas_categories_category ON areas_categories (category_id, area_id);
+
+        CREATE VIEW IF NOT EXISTS journal_issns (journal_id, issn) AS
+            SELECT id, identifier_1 FROM journals WHERE identifier_1 != ''
+            UNION
+            SELECT id, identifier_2 FROM journals WHERE identifier_2 != ''
+            UNION
+            SELECT id, NULL FROM journals WHERE COALESCE(identifier_1, '') = '' AND COALESCE(identifier_2, '') = '';
+
+        CREATE TABLE IF NOT EXISTS issn_categories (
+            issn TEXT,
+            journal_id INTEGER NOT NULL,
+            identifier_1 TEXT,
+            identifier_2 TEXT,
+            name TEXT NOT NULL,
+            quartile TEXT
+        );
+        CREATE INDEX IF NOT EXISTS issn_categories_issn ON issn_categories (issn);
+        CREATE INDEX IF NOT EXISTS issn_categories_name_quartile
+            ON issn_categories (name, quartile, identifier_1, identifier_2, journal_id);
+
+        CREATE TABLE IF NOT EXISTS issn_areas (
+            issn TEXT,
+            journal_id INTEGER NOT NULL,
+            identifier_1 TEXT,
+            identifier_2 TEXT,
+            name TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS issn_areas_issn ON issn_areas (issn);
+        CREATE INDEX IF NOT EXISTS issn_areas_name ON issn_areas (name, identifier_1, identifier_2);
+        CREATE INDEX IF NOT EXISTS issn_areas_journal ON issn_areas (journal_id, name);
+    """
+
+    # One row per ISSN and category or area, so lookups by ISSN or by name never join
+    LOOKUP_TABLES = """
+        DELETE FROM issn_categories;
+        INSERT INTO issn_categories (issn, journal_id, identifier_1, identifier_2, name, quartile)
+            SELECT journal_issns.issn, journals.id, journals.identifier_1, journals.identifier_2,
+                   categories.name, categories.quartile
+            FROM journal_issns
+            JOIN journals ON journals.id = journal_issns.journal_id
+            JOIN journals_categories ON journals_categories.journal_id = journals.id
+            JOIN categories ON categories.id = journals_categories.category_id;
+
+        DELETE FROM issn_areas;
+        INSERT INTO issn_areas (issn, journal_id, identifier_1, identifier_2, name)
+            SELECT journal_issns.issn, journals.id, journals.identifier_1, journals.identifier_2, areas.name
+            FROM journal_issns
+            JOIN journals ON journals.id = journal_issns.journal_id
+            JOIN journals_areas ON journals_areas.journal_id = journals.id
+            JOIN areas ON areas.id = journals_areas.area_id;
+    """
+
+    TABLE_COLUMNS = {
+        "journals": "id, identifier_1, identifier_2",
+        "categories": "id, name, quartile",
+        "areas": "id, name",
+        "journals_categories": "journal_id, category_id",
+        "journals_areas": "journal_id, area_id",
+        "areas_categories": "area_id, category_id",
+    }
+
+    def __init__(self, upsert=False):
+        super().__init__(upsert)
 
     def pushDataToDb(self, path):
         if not self.getDbPathOrUrl():
@@ -86,7 +415,10 @@ class CategoryUploadHandler(UploadHandler):
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
 
-        journals = []
+        if self.upsert:
+            return self.upsertData(data)
+
+        journal_id_map = {}
 
         categories = set()
         areas = set()
@@ -95,14 +427,13 @@ class CategoryUploadHandler(UploadHandler):
         journals_areas = []
         areas_categories = []
 
-        for index, entry in enumerate(data):
-            journal_id = index + 1
+        for entry in data:
             identifiers = entry.get("identifiers", [])
-            journals.append((
-                journal_id,
+            key = (
                 identifiers[0] if len(identifiers) > 0 else None,
                 identifiers[1] if len(identifiers) > 1 else None,
-            ))
+            )
+            journal_id = journal_id_map.setdefault(key, len(journal_id_map) + 1)
 
             entry_categories = [
                 (cat.get("id"), cat.get("quartile") or None)
@@ -128,8 +459,8 @@ class CategoryUploadHandler(UploadHandler):
 
         df_journals = pd.DataFrame([
             {"id": jid, "identifier_1": id1, "identifier_2": id2}
-            for jid, id1, id2 in journals
-        ]).drop_duplicates(["identifier_1", "identifier_2"])
+            for (id1, id2), jid in journal_id_map.items()
+        ])
 
         df_categories = pd.DataFrame([
             {"id": cid, "name": name, "quartile": quartile}
@@ -156,19 +487,192 @@ class CategoryUploadHandler(UploadHandler):
             for a, c in areas_categories
         ]).drop_duplicates()
 
+        tables = {
+            "journals": df_journals,
+            "categories": df_categories,
+            "areas": df_areas,
+            "journals_categories": df_journals_categories,
+            "journals_areas": df_journals_areas,
+            "areas_categories": df_areas_categories,
+        }
+
         with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            df_journals.to_sql("journals", con, index=False, if_exists="replace")
-            df_categories.to_sql("categories", con, index=False, if_exists="replace")
-            df_areas.to_sql("areas", con, index=False, if_exists="replace")
-            df_journals_categories.to_sql("journals_categories", con, index=False, if_exists="replace")
-            df_journals_areas.to_sql("journals_areas", con, index=False, if_exists="replace")
-            df_areas_categories.to_sql("areas_categories", con, index=False, if_exists="replace")
+            con.executescript(self.DROP_SCHEMA + self.SCHEMA)
+            for name, df in tables.items():
+                if not df.empty:
+                    df.to_sql(name, con, index=False, if_exists="append")
+            con.executescript(self.LOOKUP_TABLES)
+            con.execute("ANALYZE")
+
+        self.stats = {"journals": len(df_journals), "inserted": len(df_journals), "updated": 0, "unchanged": 0}
+        invalidateCaches(self.getDbPathOrUrl())
+        self.emitSnapshot()
 
         return True
 
+    def upsertData(self, data):
+        entries = {}
+        for entry in data:
+            identifiers = entry.get("identifiers", [])
+            key = (
+                identifiers[0] if len(identifiers) > 0 else None,
+                identifiers[1] if len(identifiers) > 1 else None,
+            )
+            entry_categories, entry_areas = entries.setdefault(key, (set(), set()))
+            entry_categories.update((cat.get("id"), cat.get("quartile") or None) for cat in entry.get("categories", []))
+            entry_areas.update(entry.get("areas", []))
+
+        self.stats = {"journals": len(entries), "inserted": 0, "updated": 0, "unchanged": 0}
+
+        with sqlite3.connect(self.getDbPathOrUrl()) as con:
+            self.migrateSchema(con)
+            con.executescript(self.SCHEMA)
+
+            journals = {}
+            issn_map = {}
+            for jid, id1, id2 in con.execute("SELECT id, identifier_1, identifier_2 FROM journals"):
+                journals[jid] = (id1, id2)
+                for issn in (id1, id2):
+                    if issn:
+                        issn_map[issn] = jid
+
+            categories = con.execute("SELECT id, name, quartile FROM categories")
+            category_id_map = {(name, quartile): cid for cid, name, quartile in categories}
+            area_id_map = {name: aid for aid, name in con.execute("SELECT id, name FROM areas")}
+
+            stored_categories = {}
+            for jid, cid in con.execute("SELECT journal_id, category_id FROM journals_categories"):
+                stored_categories.setdefault(jid, set()).add(cid)
+
+            stored_areas = {}
+            for jid, aid in con.execute("SELECT journal_id, area_id FROM journals_areas"):
+                stored_areas.setdefault(jid, set()).add(aid)
+
+            for key, (entry_categories, entry_areas) in entries.items():
+                category_ids = set()
+                for category in entry_categories:
+                    if category not in category_id_map:
+                        cursor = con.execute("INSERT INTO categories (name, quartile) VALUES (?, ?)", category)
+                        category_id_map[category] = cursor.lastrowid
+                    category_ids.add(category_id_map[category])
+
+                area_ids = set()
+                for area in entry_areas:
+                    if area not in area_id_map:
+                        cursor = con.execute("INSERT INTO areas (name) VALUES (?)", (area,))
+                        area_id_map[area] = cursor.lastrowid
+                    area_ids.add(area_id_map[area])
+
+                jid = next((issn_map[issn] for issn in key if issn in issn_map), None)
+                if jid is None:
+                    jid = con.execute("INSERT INTO journals (identifier_1, identifier_2) VALUES (?, ?)", key).lastrowid
+                    self.stats["inserted"] += 1
+                elif (journals[jid] == key
+                        and stored_categories.get(jid, set()) == category_ids
+                        and stored_areas.get(jid, set()) == area_ids):
+                    self.stats["unchanged"] += 1
+                    continue
+                else:
+                    con.execute("UPDATE journals SET identifier_1 = ?, identifier_2 = ? WHERE id = ?", (*key, jid))
+                    con.execute("DELETE FROM journals_categories WHERE journal_id = ?", (jid,))
+                    con.execute("DELETE FROM journals_areas WHERE journal_id = ?", (jid,))
+                    self.stats["updated"] += 1
+
+                journals[jid] = key
+                for issn in key:
+                    if issn:
+                        issn_map[issn] = jid
+
+                con.executemany("INSERT INTO journals_categories (journal_id, category_id) VALUES (?, ?)",
+                                [(jid, cid) for cid in category_ids])
+                con.executemany("INSERT INTO journals_areas (journal_id, area_id) VALUES (?, ?)",
+                                [(jid, aid) for aid in area_ids])
+
+            if self.stats["inserted"] or self.stats["updated"]:
+                con.executescript("""
+                    DELETE FROM areas_categories;
+                    INSERT INTO areas_categories (area_id, category_id)
+                        SELECT DISTINCT journals_areas.area_id, journals_categories.category_id
+                        FROM journals_areas
+                        JOIN journals_categories ON journals_areas.journal_id = journals_categories.journal_id;
+                    DELETE FROM categories WHERE id NOT IN (SELECT category_id FROM journals_categories);
+                    DELETE FROM areas WHERE id NOT IN (SELECT area_id FROM journals_areas);
+                """ + self.LOOKUP_TABLES + "ANALYZE;")
+            elif con.execute("""
+                    SELECT NOT EXISTS (SELECT 1 FROM issn_categories) AND NOT EXISTS (SELECT 1 FROM issn_areas)
+                """).fetchone()[0]:
+                # Stores written before the lookup tables existed get them on their next upsert
+                con.executescript(self.LOOKUP_TABLES + "ANALYZE;")
+
+        if self.stats["inserted"] or self.stats["updated"]:
+            invalidateCaches(self.getDbPathOrUrl())
+        self.emitSnapshot()
+
+        return True
+
+    def migrateSchema(self, con):
+        # Stores written before the typed schema have plain id columns, which would give upserted rows NULL ids
+        columns = con.execute("PRAGMA table_info(journals)").fetchall()
+        if not columns or any(column[1] == "id" and column[5] for column in columns):
+            return False
+
+        tables = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        legacy = [table for table in self.TABLE_COLUMNS if table in tables]
+
+        script = ["BEGIN;"]
+        script.extend(f"ALTER TABLE {table} RENAME TO legacy_{table};" for table in legacy)
+        script.append(self.DROP_SCHEMA + self.SCHEMA)
+        for table in legacy:
+            columns = self.TABLE_COLUMNS[table]
+            script.append(f"INSERT OR IGNORE INTO {table} ({columns}) SELECT {columns} FROM legacy_{table};")
+            script.append(f"DROP TABLE legacy_{table};")
+        script.append("COMMIT;")
+        con.executescript("\n".join(script))
+
+        return True
+
+    def emitSnapshot(self):
+        if not self.getSnapshotPath():
+            return False
+
+        with CategoryQueryHandler() as query:
+            query.setDbPathOrUrl(self.getDbPathOrUrl())
+            frames = [
+                query.getAllJournalIdentifiers(),
+                query.getAllCategories(),
+                query.getAllAreas(),
+                query.getAllJournalCategories(),
+                query.getAllJournalAreas(),
+                query.getAllAreaCategories(),
+            ]
+
+        return Snapshot.saveSources(self.getSnapshotPath(), "relational", frames)
+
 class QueryHandler(Handler):
     def __init__(self):
         super().__init__()
+        self.cache = None
+
+    def setDbPathOrUrl(self, dbPathOrUrl):
+        if super().setDbPathOrUrl(dbPathOrUrl):
+            if self.cache is not None:
+                self.cache.clear()
+                self.cache.watch(dbPathOrUrl)
+            return True
+        else:
+            return False
+
+    def enableCache(self, maxSize=128, ttl=300):
+        self.cache = ResultCache(maxSize, ttl)
+        self.cache.watch(self.getDbPathOrUrl())
+        return True
+
+    def disableCache(self):
+        self.cache = None
+        return True
+
+    def getCacheStats(self):
+        return self.cache.getStats() if self.cache is not None else None
 
     def getById(self, id):
         pass # Implemented in subclasses
@@ -181,6 +685,7 @@ class JournalQueryHandler(QueryHandler):
 
         SELECT ?title ?identifier ?languages ?publisher ?seal ?licence ?apc
         WHERE {{
+            {filter}
             ?journal rdf:type schema:Periodical ;
                      schema:name ?title ;
                      schema:identifier ?identifier ;
@@ -189,287 +694,1029 @@ class JournalQueryHandler(QueryHandler):
                      wiki:Q73548471 ?seal ;
                      schema:license ?licence ;
                      wiki:Q15291071 ?apc .
-                     {filter}
         }}
     """
 
-    def __init__(self):
+    COUNT_QUERY = BASE_QUERY.replace("SELECT ?title ?identifier ?languages ?publisher ?seal ?licence ?apc",
+                                     "SELECT (COUNT(*) AS ?count)")
+
+    PAGE_QUERY = BASE_QUERY.replace("SELECT ?title", "SELECT ?journal ?title").rstrip() + """
+        ORDER BY STR(?journal)
+    """
+
+    IDENTIFIERS_QUERY = """
+        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+        PREFIX schema: <https://schema.org/>
+
+        SELECT ?identifier
+        WHERE {
+            ?journal rdf:type schema:Periodical ;
+                     schema:identifier ?identifier .
+        }
+    """
+
+    SEARCH_QUERY = """
+        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+        PREFIX schema: <https://schema.org/>
+
+        SELECT ?identifier ?title ?publisher
+        WHERE {
+            ?journal rdf:type schema:Periodical ;
+                     schema:identifier ?identifier ;
+                     schema:name ?title ;
+                     schema:publisher ?publisher .
+        }
+    """
+
+    FLAGS_QUERY = """
+        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+        PREFIX schema: <https://schema.org/>
+        PREFIX wiki: <https://www.wikidata.org/wiki/>
+
+        SELECT ?identifier ?seal ?licence ?apc
+        WHERE {
+            ?journal rdf:type schema:Periodical ;
+                     schema:identifier ?identifier ;
+                     wiki:Q73548471 ?seal ;
+                     schema:license ?licence ;
+                     wiki:Q15291071 ?apc .
+        }
+    """
+
+    LAYOUT_QUERY = """
+        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
+        PREFIX schema: <https://schema.org/>
+
+        SELECT ?missing
+        WHERE {
+            {
+                SELECT ("issn" AS ?missing)
+                WHERE {
+                    ?journal rdf:type schema:Periodical ;
+                             schema:identifier ?identifier .
+                    FILTER(STR(?identifier) != ",")
+                    FILTER NOT EXISTS { ?journal schema:issn ?issn }
+                }
+                LIMIT 1
+            }
+            UNION
+            {
+                SELECT ("licence" AS ?missing)
+                WHERE {
+                    ?journal rdf:type schema:Periodical ;
+                             schema:license ?licence .
+                    FILTER(STR(?licence) != "")
+                    FILTER NOT EXISTS { ?journal <https://www.wikidata.org/wiki/Property:P275> ?licenceTerm }
+                }
+                LIMIT 1
+            }
+        }
+    """
+
+    PAGE_FILTER = """{{
+                SELECT ?journal
+                WHERE {{
+                    ?journal rdf:type schema:Periodical .
+                    FILTER(STR(?journal) > {after})
+                }}
+                ORDER BY STR(?journal)
+                LIMIT {limit}
+            }}"""
+
+    ID_FILTER = """{values}
+            ?journal schema:issn ?id ."""
+
+    TITLE_FILTER = """{values}
+            FILTER(CONTAINS(LCASE(STR(?title)), LCASE(?term)))"""
+
+    PUBLISHER_FILTER = """{values}
+            FILTER(CONTAINS(LCASE(STR(?publisher)), LCASE(?term)))"""
+
+    LICENCE_FILTER = """{{
+                SELECT DISTINCT ?journal
+                WHERE {{
+                    {values}
+                    ?journal <https://www.wikidata.org/wiki/Property:P275> ?licenceTerm .
+                }}
+            }}"""
+
+    LEGACY_ID_FILTER = """{{
+                SELECT DISTINCT ?journal
+                WHERE {{
+                    {values}
+                    ?journal schema:identifier ?identifierText .
+                    FILTER(CONTAINS(CONCAT(",", STR(?identifierText), ","), CONCAT(",", ?id, ",")))
+                }}
+            }}"""
+
+    LEGACY_LICENCE_FILTER = """{{
+                SELECT DISTINCT ?journal
+                WHERE {{
+                    {values}
+                    ?journal schema:license ?licenceText .
+                    FILTER(CONTAINS(CONCAT(", ", STR(?licenceText), ", "), CONCAT(", ", ?licenceTerm, ", ")))
+                }}
+            }}"""
+
+    APC_FILTER = '?journal wiki:Q15291071 "Yes" .'
+    NO_APC_FILTER = '?journal wiki:Q15291071 "No" .'
+    SEAL_FILTER = '?journal wiki:Q73548471 "Yes" .'
+
+    IDS_CHUNK_SIZE = 200
+
+    RESULT_FORMATS = {
+        "json": "application/sparql-results+json",
+        "tsv": "text/tab-separated-values",
+    }
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    TSV_ESCAPES = {"\\t": "\t", "\\n": "\n", "\\r": "\r", '\\"': '"', "\\'": "'", "\\\\": "\\"}
+
+    def __init__(self, timeout=60, retries=3, backoff=0.5, poolSize=10, resultFormat="json"):
         super().__init__()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.poolSize = poolSize
+        self.resultFormat = resultFormat
+        self.session = None
+        self.missingTriples = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def setDbPathOrUrl(self, dbPathOrUrl):
+        if super().setDbPathOrUrl(dbPathOrUrl):
+            self.clear()
+            watchLocation(self, dbPathOrUrl)
+            return True
+        else:
+            return False
+
+    def clear(self):
+        # Also called by invalidateCaches, as an upload may add the triples the store was missing
+        self.missingTriples = None
+        return True
+
+    def checkLayout(self):
+        if self.missingTriples is None:
+            self.missingTriples = self.readMissingTriples(self.runQuery(self.LAYOUT_QUERY))
 
+        return self.missingTriples
+
+    def getSession(self):
+        with self.lock:
+            if self.session is None:
+                # Read-only queries are safe to repeat, so POSTs are retried as well
+                retry = Retry(total=self.retries, backoff_factor=self.backoff,
+                              status_forcelist=self.RETRY_STATUSES, allowed_methods=None)
+                adapter = HTTPAdapter(pool_connections=self.poolSize, pool_maxsize=self.poolSize, max_retries=retry)
+
+                self.session = requests.Session()
+                self.session.mount("http://", adapter)
+                self.session.mount("https://", adapter)
+                self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+
+            return self.session
+
+    def close(self):
+        with self.lock:
+            if self.session is not None:
+                self.session.close()
+            self.session = None
+
+        return True
+
+    @cached
     def getById(self, id):
         if not id:
             return pd.DataFrame()
 
-        filter = f'FILTER(CONTAINS(CONCAT(",", STR(?identifier), ","), ",{id},"))'
-        query = self.BASE_QUERY.format(filter=filter)
-
-        endpoint = self.getDbPathOrUrl()
-        df = get(endpoint, query, True)
+        self.checkLayout()
+        query = self.BASE_QUERY.format(filter=self.buildIdFilter(id))
 
-        return df
+        return self.runQuery(query)
 
+    @cached
     def getAllJournals(self):
-        filter = ""
-        query = self.BASE_QUERY.format(filter=filter)
-
-        endpoint = self.getDbPathOrUrl()
-        df = get(endpoint, query, True)
+        query = self.BASE_QUERY.format(filter="")
 
-        return df
+        return self.runQuery(query)
 
+    @cached
     def getJournalsWithTitle(self, partialTitle):
-        filter = f'FILTER(CONTAINS(LCASE(STR(?title)), LCASE("{partialTitle}")))'
-        query = self.BASE_QUERY.format(filter=filter)
-
-        endpoint = self.getDbPathOrUrl()
-        df = get(endpoint, query, True)
+        query = self.BASE_QUERY.format(filter=self.buildTitleFilter(partialTitle))
 
-        return df
+        return self.runQuery(query)
 
+    @cached
     def getJournalsPublishedBy(self, partialName):
-        filter = f'FILTER(CONTAINS(LCASE(STR(?publisher)), LCASE("{partialName}")))'
-        query = self.BASE_QUERY.format(filter=filter)
-
-        endpoint = self.getDbPathOrUrl()
-        df = get(endpoint, query, True)
+        query = self.BASE_QUERY.format(filter=self.buildPublisherFilter(partialName))
 
-        return df
+        return self.runQuery(query)
 
+    @cached
     def getJournalsWithLicense(self, licenses):
         if not licenses:
             return self.getAllJournals()
+
+        self.checkLayout()
+        query = self.BASE_QUERY.format(filter=self.buildLicenseFilter(licenses))
+
+        return self.runQuery(query)
+
+    @cached
+    def getJournalsWithAPC(self):
+        query = self.BASE_QUERY.format(filter=self.APC_FILTER)
+
+        return self.runQuery(query)
+
+    @cached
+    def getJournalsWithoutAPC(self):
+        query = self.BASE_QUERY.format(filter=self.NO_APC_FILTER)
+
+        return self.runQuery(query)
+
+    @cached
+    def getJournalsWithDOAJSeal(self):
+        query = self.BASE_QUERY.format(filter=self.SEAL_FILTER)
+
+        return self.runQuery(query)
+
+    def getByIds(self, ids):
+        return self.getJournalsByIds(ids)
+
+    @cached
+    def getIdentifiers(self):
+        return self.readIdentifiers(self.runQuery(self.IDENTIFIERS_QUERY))
+
+    def getSearchTerms(self):
+        return self.runQuery(self.SEARCH_QUERY)
+
+    def getFlags(self):
+        return self.runQuery(self.FLAGS_QUERY)
+
+    def iterAllJournals(self, batchSize=1000):
+        for df in self.iterJournalPages(batchSize):
+            yield df.drop(columns="journal")
+
+    def iterJournalPages(self, batchSize=1000):
+        after = ""
+        while True:
+            df = self.runQuery(self.buildPageQuery(after, batchSize))
+            if df.empty:
+                return
+
+            after = df["journal"].iloc[-1]
+            yield df
+
+            if df["journal"].nunique() < batchSize:
+                return
+
+    def getJournalsByIds(self, ids):
+        ids = [id for id in dict.fromkeys(ids) if id]
+        if not ids:
+            return pd.DataFrame()
+
+        self.checkLayout()
+        queries = self.buildIdsQueries(ids)
+        all_dfs = [self.runQuery(query) for query in queries]
+
+        return pd.concat(all_dfs).drop_duplicates().reset_index(drop=True)
+
+    def countAllJournals(self):
+        return self.countJournals("")
+
+    def countJournalsWithLicense(self, licenses):
+        if not licenses:
+            return self.countAllJournals()
+
+        self.checkLayout()
+        return self.countJournals(self.buildLicenseFilter(licenses))
+
+    def countJournalsWithoutAPC(self):
+        return self.countJournals(self.NO_APC_FILTER)
+
+    @cached
+    def countJournals(self, filter):
+        query = self.COUNT_QUERY.format(filter=filter)
+
+        return self.readCount(self.runQuery(query))
+
+    def runQuery(self, query):
+        response = self.getSession().post(self.getDbPathOrUrl(), data=query.encode("utf-8"),
+                                          headers=self.getQueryHeaders(), timeout=self.timeout)
+        response.raise_for_status()
+        response.encoding = "utf-8"
+
+        return self.readResults(response.text)
+
+    def getQueryHeaders(self):
+        return {"Content-Type": "application/sparql-query", "Accept": self.RESULT_FORMATS[self.resultFormat]}
+
+    def readResults(self, text):
+        if self.resultFormat == "tsv":
+            return self.readTsvResults(text)
         else:
-            conditions = []
-            for lic in licenses:
-                condition = f'CONTAINS(CONCAT(", ", STR(?licence), ", "), ", {lic}, ")'
-                conditions.append(condition)
+            return self.readJsonResults(text)
 
-        filter = "FILTER(" + " || ".join(conditions) + ")"
-        query = self.BASE_QUERY.format(filter=filter)
+    def readJsonResults(self, text):
+        results = json.loads(text)
+        columns = results["head"]["vars"]
+        bindings = results["results"]["bindings"]
 
-        endpoint = self.getDbPathOrUrl()
-        df = get(endpoint, query, True)
+        data = {}
+        for column in columns:
+            data[column] = [binding[column]["value"] if column in binding else None for binding in bindings]
 
-        return df
+        return pd.DataFrame(data, columns=columns)
 
-    def getJournalsWithAPC(self):
-        filter = 'FILTER(STR(?apc) = "Yes")'
-        query = self.BASE_QUERY.format(filter=filter)
+    def readTsvResults(self, text):
+        lines = text.split("\n")
+        columns = [column.lstrip("?$") for column in lines[0].rstrip("\r").split("\t")]
+        rows = [line.rstrip("\r").split("\t") for line in lines[1:] if line.rstrip("\r")]
 
-        endpoint = self.getDbPathOrUrl()
-        df = get(endpoint, query, True)
+        df = pd.DataFrame(rows, columns=columns, dtype=object)
+        for column in columns:
+            df[column] = self.readTsvTerms(df[column])
 
         return df
 
-    def getJournalsWithoutAPC(self):
-        filter = 'FILTER(STR(?apc) = "No")'
-        query = self.BASE_QUERY.format(filter=filter)
+    def readTsvTerms(self, terms):
+        terms = terms.fillna("")
 
-        endpoint = self.getDbPathOrUrl()
-        df = get(endpoint, query, True)
+        literals = terms.str.extract(r'^"(.*)"(?:@[A-Za-z0-9-]+|\^\^<[^>]*>)?$', expand=False)
+        literals = literals.str.replace(r'\\[tnr"\'\\]', lambda match: self.TSV_ESCAPES[match.group(0)], regex=True)
+        iris = terms.str.extract(r"^<(.*)>$", expand=False)
 
-        return df
+        values = literals.fillna(iris).fillna(terms)
 
-    def getJournalsWithDOAJSeal(self):
-        filter = 'FILTER(STR(?seal) = "Yes")'
-        query = self.BASE_QUERY.format(filter=filter)
+        # Unbound variables come through as empty fields
+        return values.where(terms != "", None)
 
-        endpoint = self.getDbPathOrUrl()
-        df = get(endpoint, query, True)
+    def readIdentifiers(self, df):
+        if df.empty:
+            return pd.DataFrame(columns=["id", "model"])
 
-        return df
+        # The combined identifier literal is read so that stores without issn triples are covered too
+        ids = df["identifier"].fillna("").str.split(",").explode()
+        ids = ids[ids != ""].drop_duplicates()
+
+        return pd.DataFrame({"id": ids.tolist(), "model": "journal"})
+
+    def readCount(self, df):
+        return int(df["count"].iloc[0]) if not df.empty else 0
+
+    def readMissingTriples(self, df):
+        # Stores uploaded before the issn and licence triples existed are matched on the combined literals
+        return frozenset(df["missing"].dropna().tolist()) if not df.empty else frozenset()
+
+    def buildIdFilter(self, id):
+        return self.buildIdsFilter([id])
+
+    def buildIdsFilter(self, ids):
+        template = self.LEGACY_ID_FILTER if "issn" in (self.missingTriples or ()) else self.ID_FILTER
+
+        return template.format(values=self.buildValues("id", ids))
+
+    def buildTitleFilter(self, partialTitle):
+        return self.TITLE_FILTER.format(values=self.buildValues("term", [partialTitle]))
+
+    def buildPublisherFilter(self, partialName):
+        return self.PUBLISHER_FILTER.format(values=self.buildValues("term", [partialName]))
+
+    def buildLicenseFilter(self, licenses):
+        template = self.LEGACY_LICENCE_FILTER if "licence" in (self.missingTriples or ()) else self.LICENCE_FILTER
+
+        return template.format(values=self.buildValues("licenceTerm", licenses))
+
+    def buildValues(self, variable, values):
+        # Values are sorted so that the same arguments always give the same query text
+        literals = " ".join(self.escapeLiteral(value) for value in sorted(set(values)))
+
+        return f"VALUES ?{variable} {{ {literals} }}"
+
+    def escapeLiteral(self, value):
+        return '"' + str(value).translate(NT_ESCAPES) + '"'
+
+    def buildPageQuery(self, after, batchSize):
+        # Keyset pagination on the journal IRI skips no rows, but the store still filters and sorts
+        # every journal after the key for each page, so pages get cheaper only as fewer journals remain
+        filter = self.PAGE_FILTER.format(after=self.escapeLiteral(after), limit=int(batchSize))
+
+        return self.PAGE_QUERY.format(filter=filter)
+
+    def buildIdsQueries(self, ids):
+        ids = [id for id in dict.fromkeys(ids) if id]
+
+        queries = []
+        for start in range(0, len(ids), self.IDS_CHUNK_SIZE):
+            filter = self.buildIdsFilter(ids[start:start + self.IDS_CHUNK_SIZE])
+            queries.append(self.BASE_QUERY.format(filter=filter))
+
+        return queries
 
 class CategoryQueryHandler(QueryHandler):
-    def __init__(self):
+    def __init__(self, cacheSize=-65536, mmapSize=268435456):
         super().__init__()
+        self.cacheSize = cacheSize
+        self.mmapSize = mmapSize
+        self.connections = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def setDbPathOrUrl(self, dbPathOrUrl):
+        if super().setDbPathOrUrl(dbPathOrUrl):
+            self.close()
+            return True
+        else:
+            return False
+
+    def getConnection(self):
+        con = getattr(self.local, "connection", None)
+        if con is None:
+            uri = Path(self.getDbPathOrUrl()).resolve().as_uri() + "?mode=ro"
+            con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            con.execute(f"PRAGMA cache_size = {int(self.cacheSize)}")
+            con.execute(f"PRAGMA mmap_size = {int(self.mmapSize)}")
+
+            with self.lock:
+                self.connections.append(con)
+            self.local.connection = con
+
+        return con
+
+    def close(self):
+        with self.lock:
+            for con in self.connections:
+                con.close()
+            self.connections.clear()
+            self.local = threading.local()
+
+        return True
 
+    @cached
     def getById(self, id):
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            area_query = f"SELECT * FROM areas WHERE name = '{id}' LIMIT 1"
-            area_df = pd.read_sql(area_query, con)
-            if not area_df.empty:
-                return area_df.assign(model="area")
+        con = self.getConnection()
+        # Areas win over categories, and categories over journals, as with separate lookups
+        query = """
+            SELECT model, name, quartile, identifier_1, identifier_2
+            FROM (
+                SELECT 1 AS rank, 'area' AS model, name, NULL AS quartile,
+                       NULL AS identifier_1, NULL AS identifier_2
+                FROM (SELECT name FROM areas WHERE name = :id LIMIT 1)
+                UNION ALL
+                SELECT 2, 'category', name, quartile, NULL, NULL
+                FROM (SELECT name, quartile FROM categories WHERE name = :id LIMIT 1)
+                UNION ALL
+                SELECT 3, 'journal', NULL, NULL, identifier_1, identifier_2
+                FROM (SELECT identifier_1, identifier_2 FROM journals
+                      WHERE identifier_1 = :id OR identifier_2 = :id LIMIT 1)
+            )
+            ORDER BY rank
+            LIMIT 1
+        """
+        df = pd.read_sql(query, con, params={"id": id})
+
+        return df if not df.empty else pd.DataFrame()
 
-            category_query = f"SELECT * FROM categories WHERE name = '{id}' LIMIT 1"
-            category_df = pd.read_sql(category_query, con)
-            if not category_df.empty:
-                return category_df.assign(model="category")
+    @cached
+    def getByIds(self, ids):
+        ids = [id for id in dict.fromkeys(ids) if id]
+        if not ids:
+            return pd.DataFrame()
 
-            journal_query = f"SELECT * FROM journals WHERE identifier_1 = '{id}' OR identifier_2 = '{id}' LIMIT 1"
-            journal_df = pd.read_sql(journal_query, con)
-            if not journal_df.empty:
-                return journal_df.assign(model="journal")
+        con = self.getConnection()
+        query = """
+            WITH wanted(id) AS (SELECT value FROM json_each(:ids))
+            SELECT 1 AS rank, 'area' AS model, name AS id, name, NULL AS quartile,
+                   NULL AS identifier_1, NULL AS identifier_2
+            FROM areas WHERE name IN wanted
+            UNION ALL
+            SELECT 2, 'category', name, name, quartile, NULL, NULL
+            FROM categories WHERE name IN wanted GROUP BY name
+            UNION ALL
+            SELECT 3, 'journal', identifier_1, NULL, NULL, identifier_1, identifier_2
+            FROM journals WHERE identifier_1 IN wanted
+            UNION ALL
+            SELECT 3, 'journal', identifier_2, NULL, NULL, identifier_1, identifier_2
+            FROM journals WHERE identifier_2 IN wanted
+        """
+        df = pd.read_sql(query, con, params={"ids": json.dumps(ids)})
+
+        # Keep one row per id, with the same precedence as getById
+        df = df.sort_values("rank", kind="stable").drop_duplicates("id").drop(columns="rank")
+
+        return df.reset_index(drop=True)
+
+    @cached
+    def getIdentifiers(self):
+        con = self.getConnection()
+        query = """
+            SELECT identifier_1 AS id, 'journal' AS model FROM journals WHERE identifier_1 != ''
+            UNION ALL
+            SELECT identifier_2, 'journal' FROM journals WHERE identifier_2 != ''
+            UNION ALL
+            SELECT DISTINCT name, 'category' FROM categories
+            UNION ALL
+            SELECT name, 'area' FROM areas
+        """
+        df = pd.read_sql(query, con)
 
-        return pd.DataFrame()
+        return df
 
+    @cached
     def getAllCategories(self):
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            query = "SELECT * FROM categories"
-            df = pd.read_sql(query, con)
+        con = self.getConnection()
+        query = "SELECT * FROM categories"
+        df = pd.read_sql(query, con)
 
         return df.drop(columns=["id"])
 
+    @cached
     def getAllAreas(self):
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            query = "SELECT * FROM areas"
-            df = pd.read_sql(query, con)
+        con = self.getConnection()
+        query = "SELECT * FROM areas"
+        df = pd.read_sql(query, con)
 
         return df.drop(columns=["id"])
 
+    @cached
     def getCategoriesWithQuartile(self, quartiles=set()):
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            if not quartiles:
-                query = "SELECT * FROM categories"
-            else:
-                q = ','.join(f"'{item}'" for item in quartiles if item is not None)
-                query = f"SELECT * FROM categories WHERE quartile IN ({q})"
-                if None in quartiles:
-                    query += " OR quartile IS NULL"
+        con = self.getConnection()
+        if not quartiles:
+            query = "SELECT * FROM categories"
+            params = {}
+        else:
+            query = """
+                SELECT * FROM categories
+                WHERE quartile IN (SELECT value FROM json_each(:quartiles))
+                   OR (:withNull AND quartile IS NULL)
+            """
+            params = {"quartiles": self.encodeSet(quartiles), "withNull": None in quartiles}
 
-            df = pd.read_sql(query, con)
+        df = pd.read_sql(query, con, params=params)
 
         return df.drop(columns=["id"])
 
+    @cached
     def getCategoriesAssignedToAreas(self, area_ids=set()):
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            if not area_ids:
-                query = """
-                    SELECT DISTINCT categories.name, categories.quartile
-                    FROM categories
-                    JOIN areas_categories ON categories.id = areas_categories.category_id;
-                """
-            else:
-                a = ','.join(f"'{item}'" for item in area_ids)
-                query = f"""
-                    SELECT DISTINCT categories.name, categories.quartile
-                    FROM categories
-                    JOIN areas_categories ON areas_categories.category_id = categories.id
-                    JOIN areas ON areas.id = areas_categories.area_id
-                    WHERE areas.name IN ({a})
-                """
+        con = self.getConnection()
+        if not area_ids:
+            query = """
+                SELECT DISTINCT categories.name, categories.quartile
+                FROM categories
+                JOIN areas_categories ON categories.id = areas_categories.category_id
+            """
+            params = {}
+        else:
+            query = """
+                SELECT DISTINCT categories.name, categories.quartile
+                FROM categories
+                JOIN areas_categories ON areas_categories.category_id = categories.id
+                JOIN areas ON areas.id = areas_categories.area_id
+                WHERE areas.name IN (SELECT value FROM json_each(:areas))
+            """
+            params = {"areas": self.encodeSet(area_ids)}
 
-            df = pd.read_sql(query, con)
+        df = pd.read_sql(query, con, params=params)
 
         return df
 
+    @cached
     def getAreasAssignedToCategories(self, category_ids=set()):
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            if not category_ids:
-                query = """
-                    SELECT DISTINCT areas.name
-                    FROM areas
-                    JOIN areas_categories ON areas.id = areas_categories.area_id;
-                """
-            else:
-                c = ','.join(f"'{item}'" for item in category_ids)
-                query = f"""
-                    SELECT DISTINCT areas.name
-                    FROM areas
-                    JOIN areas_categories ON areas_categories.area_id = areas.id
-                    JOIN categories ON categories.id = areas_categories.category_id
-                    WHERE categories.name IN ({c})
-                """
+        con = self.getConnection()
+        if not category_ids:
+            query = """
+                SELECT DISTINCT areas.name
+                FROM areas
+                JOIN areas_categories ON areas.id = areas_categories.area_id
+            """
+            params = {}
+        else:
+            query = """
+                SELECT DISTINCT areas.name
+                FROM areas
+                JOIN areas_categories ON areas_categories.area_id = areas.id
+                JOIN categories ON categories.id = areas_categories.category_id
+                WHERE categories.name IN (SELECT value FROM json_each(:categories))
+            """
+            params = {"categories": self.encodeSet(category_ids)}
 
-            df = pd.read_sql(query, con)
+        df = pd.read_sql(query, con, params=params)
 
         return df
 
+    @cached
     def getJournalCategories(self, journal_ids):
-        q = ','.join(f"'{item}'" for item in journal_ids if item is not None)
-        query = f"""
-            SELECT categories.name, categories.quartile
-            FROM categories
-            JOIN journals_categories ON categories.id = journals_categories.category_id
-            JOIN journals ON journals_categories.journal_id = journals.id
-            WHERE journals.identifier_1 IN ({q}) OR journals.identifier_2 IN ({q})
+        query = """
+            SELECT name, quartile
+            FROM (
+                SELECT DISTINCT issn_categories.journal_id, issn_categories.name, issn_categories.quartile
+                FROM json_each(:ids) AS ids
+                CROSS JOIN issn_categories ON issn_categories.issn = ids.value
+            )
         """
 
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            df = pd.read_sql(query, con)
+        con = self.getConnection()
+        df = pd.read_sql(query, con, params={"ids": self.encodeSet(journal_ids)})
 
         return df
 
+    @cached
     def getJournalAreas(self, journal_ids):
-        q = ','.join(f"'{item}'" for item in journal_ids if item is not None)
-        query = f"""
-            SELECT areas.name
-            FROM areas
-            JOIN journals_areas ON areas.id = journals_areas.area_id
-            JOIN journals ON journals_areas.journal_id = journals.id
-            WHERE journals.identifier_1 IN ({q}) OR journals.identifier_2 IN ({q})
+        query = """
+            SELECT name
+            FROM (
+                SELECT DISTINCT issn_areas.journal_id, issn_areas.name
+                FROM json_each(:ids) AS ids
+                CROSS JOIN issn_areas ON issn_areas.issn = ids.value
+            )
         """
 
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            df = pd.read_sql(query, con)
+        con = self.getConnection()
+        df = pd.read_sql(query, con, params={"ids": self.encodeSet(journal_ids)})
 
         return df
 
-    def getJournalsByCategoryWithQuartile(self, category_ids, quartiles):
-        if not category_ids or not quartiles:
-            query = "SELECT DISTINCT identifier_1, identifier_2 FROM journals"
-        else:
-            conditions = [
-                f"(categories.name = '{name}' AND categories.quartile = '{quartile}')"
-                for name in category_ids
-                for quartile in quartiles
-            ]
+    def getCategoriesOfJournals(self, journal_ids):
+        query = """
+            SELECT identifier_1, identifier_2, name, quartile
+            FROM (
+                SELECT DISTINCT issn_categories.journal_id, issn_categories.identifier_1, issn_categories.identifier_2,
+                       issn_categories.name, issn_categories.quartile
+                FROM json_each(:ids) AS ids
+                CROSS JOIN issn_categories ON issn_categories.issn = ids.value
+            )
+        """
+
+        con = self.getConnection()
+        df = pd.read_sql(query, con, params={"ids": self.encodeSet(journal_ids)})
 
-            where_clause = " OR ".join(conditions)
+        return df
 
-            query = f"""
-            SELECT DISTINCT journals.identifier_1, journals.identifier_2
+    def getAreasOfJournals(self, journal_ids):
+        query = """
+            SELECT identifier_1, identifier_2, name
+            FROM (
+                SELECT DISTINCT issn_areas.journal_id, issn_areas.identifier_1, issn_areas.identifier_2, issn_areas.name
+                FROM json_each(:ids) AS ids
+                CROSS JOIN issn_areas ON issn_areas.issn = ids.value
+            )
+        """
+
+        con = self.getConnection()
+        df = pd.read_sql(query, con, params={"ids": self.encodeSet(journal_ids)})
+
+        return df
+
+    def getAllJournalIdentifiers(self):
+        query = "SELECT identifier_1, identifier_2 FROM journals"
+
+        con = self.getConnection()
+        df = pd.read_sql(query, con)
+
+        return df
+
+    def getAllJournalCategories(self):
+        query = """
+            SELECT journals.identifier_1, journals.identifier_2, categories.name, categories.quartile
             FROM journals
             JOIN journals_categories ON journals.id = journals_categories.journal_id
             JOIN categories ON journals_categories.category_id = categories.id
-            WHERE {where_clause};
-            """
+        """
 
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            df = pd.read_sql(query, con)
+        con = self.getConnection()
+        df = pd.read_sql(query, con)
 
         return df
 
-    def getJournalsByArea(self, areas_ids):
-        if not areas_ids:
-            query = "SELECT DISTINCT identifier_1, identifier_2 FROM journals"
-        else:
-            a = ','.join(f"'{item}'" for item in areas_ids)
-            query = f"""
-            SELECT DISTINCT journals.identifier_1, journals.identifier_2
+    def getAllJournalAreas(self):
+        query = """
+            SELECT journals.identifier_1, journals.identifier_2, areas.name
             FROM journals
             JOIN journals_areas ON journals.id = journals_areas.journal_id
             JOIN areas ON journals_areas.area_id = areas.id
-            WHERE areas.name IN ({a});
-            """
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            df = pd.read_sql(query, con)
+        """
+
+        con = self.getConnection()
+        df = pd.read_sql(query, con)
+
+        return df
+
+    def getAllAreaCategories(self):
+        query = """
+            SELECT areas.name AS area, categories.name, categories.quartile
+            FROM areas_categories
+            JOIN areas ON areas_categories.area_id = areas.id
+            JOIN categories ON areas_categories.category_id = categories.id
+        """
+
+        con = self.getConnection()
+        df = pd.read_sql(query, con)
+
+        return df
+
+    @cached
+    def getJournalsByCategoryWithQuartile(self, category_ids, quartiles):
+        query, params = self.buildJournalsByCategoryWithQuartileQuery(category_ids, quartiles)
+
+        con = self.getConnection()
+        df = pd.read_sql(query, con, params=params)
 
         return df
 
+    @cached
+    def getJournalsByArea(self, areas_ids):
+        query, params = self.buildJournalsByAreaQuery(areas_ids)
+
+        con = self.getConnection()
+        df = pd.read_sql(query, con, params=params)
+
+        return df
+
+    @cached
     def getJournalsByAreaAndCategoryWithQuartile(self, areas_ids, category_ids, quartiles):
+        query, params = self.buildJournalsByAreaAndCategoryWithQuartileQuery(areas_ids, category_ids, quartiles)
+
+        con = self.getConnection()
+        df = pd.read_sql(query, con, params=params)
+
+        return df
+
+    def encodeSet(self, values):
+        # Sets are bound as one JSON array parameter, so the statement text never changes
+        return json.dumps([item for item in values if pd.notna(item)])
+
+    def buildJournalsByCategoryWithQuartileQuery(self, category_ids, quartiles):
+        if not category_ids or not quartiles:
+            return "SELECT DISTINCT identifier_1, identifier_2 FROM journals", {}
+
+        # Every name/quartile pair becomes one range scan over a covering index of the lookup table
+        query = """
+            SELECT DISTINCT issn_categories.identifier_1, issn_categories.identifier_2
+            FROM json_each(:categories) AS names
+            CROSS JOIN json_each(:quartiles) AS quartiles
+            CROSS JOIN issn_categories
+                ON issn_categories.name = names.value AND issn_categories.quartile = quartiles.value
+        """
+
+        return query, {"categories": self.encodeSet(category_ids), "quartiles": self.encodeSet(quartiles)}
+
+    def buildJournalsByAreaQuery(self, areas_ids):
+        if not areas_ids:
+            return "SELECT DISTINCT identifier_1, identifier_2 FROM journals", {}
+
+        query = """
+            SELECT DISTINCT issn_areas.identifier_1, issn_areas.identifier_2
+            FROM json_each(:areas) AS names
+            CROSS JOIN issn_areas ON issn_areas.name = names.value
+        """
+
+        return query, {"areas": self.encodeSet(areas_ids)}
+
+    def buildJournalsByAreaAndCategoryWithQuartileQuery(self, areas_ids, category_ids, quartiles):
         if not areas_ids or not category_ids or not quartiles:
-            query = "SELECT DISTINCT identifier_1, identifier_2 FROM journals"
-        else:
-            a = ','.join(f"'{item}'" for item in areas_ids)
-            conditions = [
-                f"(categories.name = '{name}' AND categories.quartile = '{quartile}')"
-                for name in category_ids
-                for quartile in quartiles
-            ]
+            return "SELECT DISTINCT identifier_1, identifier_2 FROM journals", {}
+
+        query = """
+            SELECT DISTINCT issn_categories.identifier_1, issn_categories.identifier_2
+            FROM json_each(:categories) AS names
+            CROSS JOIN json_each(:quartiles) AS quartiles
+            CROSS JOIN issn_categories
+                ON issn_categories.name = names.value AND issn_categories.quartile = quartiles.value
+            WHERE EXISTS (
+                SELECT 1 FROM issn_areas
+                WHERE issn_areas.journal_id = issn_categories.journal_id
+                  AND issn_areas.name IN (SELECT value FROM json_each(:areas))
+            )
+        """
 
-            where_clause = " OR ".join(conditions)
+        return query, {"areas": self.encodeSet(areas_ids), "categories": self.encodeSet(category_ids),
+                       "quartiles": self.encodeSet(quartiles)}
 
-            query = f"""
-            SELECT DISTINCT journals.identifier_1, journals.identifier_2
-            FROM journals
-            JOIN journals_areas ON journals.id = journals_areas.journal_id
-            JOIN areas ON journals_areas.area_id = areas.id
-            JOIN journals_categories ON journals.id = journals_categories.journal_id
-            JOIN categories ON journals_categories.category_id = categories.id
-            WHERE areas.name IN ({a}) AND ({where_clause});
-            """
+class AsyncJournalQueryHandler(JournalQueryHandler):
+    def __init__(self, connections=16, timeout=60, resultFormat="json"):
+        super().__init__(timeout=timeout, resultFormat=resultFormat)
+        self.connections = connections
+        self.clientSession = None
+        self.clientSessionLoop = None
 
-        with sqlite3.connect(self.getDbPathOrUrl()) as con:
-            df = pd.read_sql(query, con)
+    async def __aenter__(self):
+        return self
 
-        return df
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def getClientSession(self):
+        if aiohttp is None:
+            raise ImportError("AsyncJournalQueryHandler requires the aiohttp package")
+
+        # A session is tied to the loop it was opened on, so a new loop gets a new session
+        loop = asyncio.get_running_loop()
+        if self.clientSession is None or self.clientSession.closed or self.clientSessionLoop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=30)
+            self.clientSession = aiohttp.ClientSession(connector=connector,
+                                                       timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.clientSessionLoop = loop
+
+        return self.clientSession
+
+    async def aclose(self):
+        if self.clientSession is not None and not self.clientSession.closed:
+            await self.clientSession.close()
+        self.clientSession = None
+        self.clientSessionLoop = None
+
+        return True
+
+    async def runQuery(self, query):
+        session = await self.getClientSession()
+
+        async with session.post(self.getDbPathOrUrl(), data=query.encode("utf-8"),
+                                headers=self.getQueryHeaders()) as response:
+            response.raise_for_status()
+            text = await response.text(encoding="utf-8")
+
+        return self.readResults(text)
+
+    async def checkLayout(self):
+        if self.missingTriples is None:
+            self.missingTriples = self.readMissingTriples(await self.runQuery(self.LAYOUT_QUERY))
+
+        return self.missingTriples
+
+    @cached
+    async def getById(self, id):
+        if not id:
+            return pd.DataFrame()
+
+        await self.checkLayout()
+        query = self.BASE_QUERY.format(filter=self.buildIdFilter(id))
+
+        return await self.runQuery(query)
+
+    @cached
+    async def getAllJournals(self):
+        query = self.BASE_QUERY.format(filter="")
+
+        return await self.runQuery(query)
+
+    @cached
+    async def getJournalsWithTitle(self, partialTitle):
+        query = self.BASE_QUERY.format(filter=self.buildTitleFilter(partialTitle))
+
+        return await self.runQuery(query)
+
+    @cached
+    async def getJournalsPublishedBy(self, partialName):
+        query = self.BASE_QUERY.format(filter=self.buildPublisherFilter(partialName))
+
+        return await self.runQuery(query)
+
+    @cached
+    async def getJournalsWithLicense(self, licenses):
+        if not licenses:
+            return await self.getAllJournals()
+
+        await self.checkLayout()
+        query = self.BASE_QUERY.format(filter=self.buildLicenseFilter(licenses))
+
+        return await self.runQuery(query)
+
+    @cached
+    async def getJournalsWithAPC(self):
+        query = self.BASE_QUERY.format(filter=self.APC_FILTER)
+
+        return await self.runQuery(query)
+
+    @cached
+    async def getJournalsWithoutAPC(self):
+        query = self.BASE_QUERY.format(filter=self.NO_APC_FILTER)
+
+        return await self.runQuery(query)
+
+    @cached
+    async def getJournalsWithDOAJSeal(self):
+        query = self.BASE_QUERY.format(filter=self.SEAL_FILTER)
+
+        return await self.runQuery(query)
+
+    async def getByIds(self, ids):
+        return await self.getJournalsByIds(ids)
+
+    @cached
+    async def getIdentifiers(self):
+        return self.readIdentifiers(await self.runQuery(self.IDENTIFIERS_QUERY))
+
+    async def getSearchTerms(self):
+        return await self.runQuery(self.SEARCH_QUERY)
+
+    async def getFlags(self):
+        return await self.runQuery(self.FLAGS_QUERY)
+
+    async def iterAllJournals(self, batchSize=1000):
+        async for df in self.iterJournalPages(batchSize):
+            yield df.drop(columns="journal")
+
+    async def iterJournalPages(self, batchSize=1000):
+        after = ""
+        while True:
+            df = await self.runQuery(self.buildPageQuery(after, batchSize))
+            if df.empty:
+                return
+
+            after = df["journal"].iloc[-1]
+            yield df
+
+            if df["journal"].nunique() < batchSize:
+                return
+
+    async def getJournalsByIds(self, ids):
+        ids = [id for id in dict.fromkeys(ids) if id]
+        if not ids:
+            return pd.DataFrame()
+
+        await self.checkLayout()
+        queries = self.buildIdsQueries(ids)
+        all_dfs = await asyncio.gather(*(self.runQuery(query) for query in queries))
+
+        return pd.concat(all_dfs).drop_duplicates().reset_index(drop=True)
+
+    async def countAllJournals(self):
+        return await self.countJournals("")
+
+    async def countJournalsWithLicense(self, licenses):
+        if not licenses:
+            return await self.countAllJournals()
+
+        await self.checkLayout()
+        return await self.countJournals(self.buildLicenseFilter(licenses))
+
+    async def countJournalsWithoutAPC(self):
+        return await self.countJournals(self.NO_APC_FILTER)
+
+    @cached
+    async def countJournals(self, filter):
+        query = self.COUNT_QUERY.format(filter=filter)
+
+        return self.readCount(await self.runQuery(query))
+
+class AsyncCategoryQueryHandler(CategoryQueryHandler):
+    def __init__(self, cacheSize=-65536, mmapSize=268435456, workers=4):
+        super().__init__(cacheSize, mmapSize)
+        self.workers = workers
+        self.executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def getExecutor(self):
+        # SQLite calls run on a small pool, each thread keeping its own pooled connection
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    async def aclose(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+        return self.close()
+
+    getById = runsInExecutor(CategoryQueryHandler.getById)
+    getByIds = runsInExecutor(CategoryQueryHandler.getByIds)
+    getIdentifiers = runsInExecutor(CategoryQueryHandler.getIdentifiers)
+    getAllCategories = runsInExecutor(CategoryQueryHandler.getAllCategories)
+    getAllAreas = runsInExecutor(CategoryQueryHandler.getAllAreas)
+    getCategoriesWithQuartile = runsInExecutor(CategoryQueryHandler.getCategoriesWithQuartile)
+    getCategoriesAssignedToAreas = runsInExecutor(CategoryQueryHandler.getCategoriesAssignedToAreas)
+    getAreasAssignedToCategories = runsInExecutor(CategoryQueryHandler.getAreasAssignedToCategories)
+    getJournalCategories = runsInExecutor(CategoryQueryHandler.getJournalCategories)
+    getJournalAreas = runsInExecutor(CategoryQueryHandler.getJournalAreas)
+    getCategoriesOfJournals = runsInExecutor(CategoryQueryHandler.getCategoriesOfJournals)
+    getAreasOfJournals = runsInExecutor(CategoryQueryHandler.getAreasOfJournals)
+    getAllJournalIdentifiers = runsInExecutor(CategoryQueryHandler.getAllJournalIdentifiers)
+    getAllJournalCategories = runsInExecutor(CategoryQueryHandler.getAllJournalCategories)
+    getAllJournalAreas = runsInExecutor(CategoryQueryHandler.getAllJournalAreas)
+    getAllAreaCategories = runsInExecutor(CategoryQueryHandler.getAllAreaCategories)
+    getJournalsByCategoryWithQuartile = runsInExecutor(CategoryQueryHandler.getJournalsByCategoryWithQuartile)
+    getJournalsByArea = runsInExecutor(CategoryQueryHandler.getJournalsByArea)
+    getJournalsByAreaAndCategoryWithQuartile = runsInExecutor(
+        CategoryQueryHandler.getJournalsByAreaAndCategoryWithQuartile)
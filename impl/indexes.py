@@ -0,0 +1,189 @@
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from impl.caches import watchLocation
+
+def foldText(value):
+    if not isinstance(value, str):
+        return ""
+    if value.isascii():
+        return value.lower()
+
+    # Accents are split off by the decomposition and dropped, so "Études" is found by "etudes"
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+class TrigramIndex:
+    SIZE = 3
+
+    def __init__(self, values):
+        self.values = [foldText(value) for value in values]
+
+        postings = {}
+        for position, value in enumerate(self.values):
+            for gram in {value[start:start + self.SIZE] for start in range(len(value) - self.SIZE + 1)}:
+                postings.setdefault(gram, []).append(position)
+        self.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+
+    def __len__(self):
+        return len(self.values)
+
+    def search(self, term):
+        term = foldText(term)
+        if len(term) < self.SIZE:
+            # Terms shorter than a trigram have no postings, so every value is checked
+            candidates = range(len(self.values))
+        else:
+            grams = {term[start:start + self.SIZE] for start in range(len(term) - self.SIZE + 1)}
+            if not grams.issubset(self.postings):
+                return np.zeros(0, dtype=np.int32)
+
+            candidates = None
+            for gram in sorted(grams, key=lambda gram: len(self.postings[gram])):
+                positions = self.postings[gram]
+                if candidates is None:
+                    candidates = positions
+                else:
+                    candidates = np.intersect1d(candidates, positions, assume_unique=True)
+                if not len(candidates):
+                    break
+            candidates = candidates.tolist()
+
+        # Postings only prove that the trigrams occur, not that they occur in order
+        return np.array([position for position in candidates if term in self.values[position]], dtype=np.int32)
+
+class SearchIndex:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.identifiers = None
+        self.fields = None
+        self.expires = None
+        self.lock = threading.Lock()
+
+    def search(self, field, term):
+        with self.lock:
+            if self.fields is None:
+                return False, None
+            if self.expires is not None and self.expires <= time.monotonic():
+                self.identifiers = None
+                self.fields = None
+                return False, None
+
+            identifiers = self.identifiers
+            index = self.fields[field]
+
+        return True, [identifiers[position] for position in index.search(term).tolist()]
+
+    def fill(self, identifiers, fields):
+        # Postings are built outside the lock, searches keep using the old index meanwhile
+        fields = {name: TrigramIndex(values) for name, values in fields.items()}
+
+        with self.lock:
+            self.identifiers = list(identifiers)
+            self.fields = fields
+            self.expires = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.identifiers = None
+            self.fields = None
+            self.expires = None
+
+        return True
+
+    def watch(self, dbPathOrUrl):
+        return watchLocation(self, dbPathOrUrl)
+
+class BitmapIndex:
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.identifiers = None
+        self.bitmaps = None
+        self.universe = None
+        self.expires = None
+        self.lock = threading.Lock()
+
+    def match(self, allOf=(), anyOf=(), noneOf=()):
+        found, bits, identifiers = self.combine(allOf, anyOf, noneOf)
+        if not found:
+            return False, None
+
+        positions = np.flatnonzero(np.unpackbits(bits, count=len(identifiers)))
+
+        return True, [identifiers[position] for position in positions.tolist()]
+
+    def count(self, allOf=(), anyOf=(), noneOf=()):
+        found, bits, identifiers = self.combine(allOf, anyOf, noneOf)
+        if not found:
+            return False, None
+
+        return True, int(np.unpackbits(bits, count=len(identifiers)).sum())
+
+    def combine(self, allOf, anyOf, noneOf):
+        with self.lock:
+            if self.bitmaps is None:
+                return False, None, None
+            if self.expires is not None and self.expires <= time.monotonic():
+                self.identifiers = None
+                self.bitmaps = None
+                self.universe = None
+                return False, None, None
+
+            identifiers = self.identifiers
+            bitmaps = self.bitmaps
+            bits = self.universe.copy()
+
+        # Values nobody has get an all-zero bitmap, so unknown keys simply match nothing
+        empty = np.zeros_like(bits)
+        for key in allOf:
+            bits &= bitmaps.get(key, empty)
+        if anyOf:
+            union = empty.copy()
+            for key in anyOf:
+                union |= bitmaps.get(key, empty)
+            bits &= union
+        for key in noneOf:
+            bits &= ~bitmaps.get(key, empty)
+
+        return True, bits, identifiers
+
+    def fill(self, identifiers, columns):
+        identifiers = list(identifiers)
+
+        positions = {}
+        for column, values in columns.items():
+            for position, value in enumerate(values):
+                for token in ([value] if isinstance(value, str) else value):
+                    positions.setdefault((column, token), []).append(position)
+
+        bitmaps = {}
+        for key, rows in positions.items():
+            mask = np.zeros(len(identifiers), dtype=bool)
+            mask[rows] = True
+            bitmaps[key] = np.packbits(mask)
+        universe = np.packbits(np.ones(len(identifiers), dtype=bool))
+
+        with self.lock:
+            self.identifiers = identifiers
+            self.bitmaps = bitmaps
+            self.universe = universe
+            self.expires = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.identifiers = None
+            self.bitmaps = None
+            self.universe = None
+            self.expires = None
+
+        return True
+
+    def watch(self, dbPathOrUrl):
+        return watchLocation(self, dbPathOrUrl)
@@ -1,4 +1,8 @@
+import weakref
+
 class IdentifiableEntity:
+    __slots__ = ("id",)
+
     def __init__(self, id):
         if isinstance(id, list):
             self.id = id
@@ -8,11 +12,46 @@ class IdentifiableEntity:
     def getIds(self):
         return self.id
 
-class Area(IdentifiableEntity):
+class SharedEntity(IdentifiableEntity):
+    __slots__ = ("__weakref__",)
+
+    # Interned areas and categories are shared by every journal that has them, so their
+    # attributes are set once and ids are handed out as copies
+    def __init__(self, id):
+        self.id = tuple(id) if isinstance(id, list) else (id,)
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError(f"{type(self).__name__} objects are shared and cannot be changed")
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} objects are shared and cannot be changed")
+
+    def getIds(self):
+        return list(self.id)
+
+class Area(SharedEntity):
+    __slots__ = ()
+
+    # Weak values let unused areas go once no journal refers to them
+    instances = weakref.WeakValueDictionary()
+
     def __init__(self, id):
         super().__init__(id)
 
-class Category(IdentifiableEntity):
+    @classmethod
+    def intern(cls, id):
+        area = cls.instances.get(id)
+        if area is None:
+            area = cls.instances.setdefault(id, cls(id))
+        return area
+
+class Category(SharedEntity):
+    __slots__ = ("quartile",)
+
+    instances = weakref.WeakValueDictionary()
+
     def __init__(self, id, quartile=None):
         super().__init__(id)
         self.quartile = quartile
@@ -20,8 +59,19 @@ class Category(IdentifiableEntity):
     def getQuartile(self):
         return self.quartile
 
+    @classmethod
+    def intern(cls, id, quartile=None):
+        key = (id, quartile)
+        category = cls.instances.get(key)
+        if category is None:
+            category = cls.instances.setdefault(key, cls(id, quartile))
+        return category
+
 class Journal(IdentifiableEntity):
-    def __init__(self, id, title="", languages=[], publisher=None, seal=False, licence="", apc=False, categories=[], areas=[]):
+    __slots__ = ("title", "languages", "publisher", "seal", "licence", "apc", "categories", "areas")
+
+    def __init__(self, id, title="", languages=(), publisher=None, seal=False, licence="", apc=False,
+                 categories=(), areas=()):
         super().__init__(id)
         self.title = title
         self.languages = languages
@@ -36,7 +86,7 @@ class Journal(IdentifiableEntity):
         return self.title
 
     def getLanguages(self):
-        return self.languages
+        return list(self.languages)
 
     def getPublisher(self):
         return self.publisher
@@ -51,10 +101,10 @@ class Journal(IdentifiableEntity):
         return self.apc
 
     def getCategories(self):
-        return self.categories
+        return list(self.categories)
 
     def getAreas(self):
-        return self.areas
+        return list(self.areas)
 
     def hasCategory(self):
         if not self.categories:
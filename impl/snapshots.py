@@ -0,0 +1,553 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from impl.indexes import TrigramIndex
+from impl.models import Area, Category, Journal
+
+class StringTable:
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def fromStrings(cls, values):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        # Decoding from one bytes copy is much cheaper than slicing the mapped buffer per string
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode("utf-8")
+
+class Snapshot:
+    VERSION = 1
+
+    SOURCES = {
+        "graph": ("journals",),
+        "relational": ("identifiers", "categories", "areas", "journal_categories", "journal_areas", "area_categories"),
+    }
+
+    def __init__(self, arrays, tables):
+        self.arrays = arrays
+        self.tables = tables
+        self.searchIndexes = {}
+        self.values = {}
+        self.languageTuples = None
+        self.categoryObjects = None
+        self.areaObjects = None
+        self.lookups = None
+
+    @classmethod
+    def fromFrames(cls, journals_df, identifiers_df, categories_df, areas_df,
+                   journal_categories_df, journal_areas_df, area_categories_df):
+        arrays = {}
+        tables = {}
+
+        # Journals from the graph store, one row each
+        journals_df = journals_df.reset_index(drop=True)
+        tables["titles"] = journals_df["title"].fillna("").astype(str).tolist()
+        tables["identifiers"] = journals_df["identifier"].fillna("").astype(str).tolist()
+        for column, table in (("languages", "languages"), ("publisher", "publishers"), ("licence", "licences")):
+            codes, uniques = pd.factorize(journals_df[column])
+            arrays["journal_" + table] = codes.astype(np.int32)
+            tables[table] = [str(value) for value in uniques]
+        arrays["journal_seal"] = (journals_df["seal"] == "Yes").to_numpy()
+        arrays["journal_apc"] = (journals_df["apc"] == "Yes").to_numpy()
+
+        journal_issns = pd.Series(tables["identifiers"], dtype=object).str.split(",").explode()
+        journal_issns = journal_issns[journal_issns.notna() & (journal_issns != "")]
+
+        # Journals from the relational store, keyed by their identifier pair
+        pairs = cls.readPairs(identifiers_df).drop_duplicates().reset_index(drop=True)
+
+        issn_codes, issns = pd.factorize(pd.concat([journal_issns, pairs["identifier_1"], pairs["identifier_2"]]))
+        issns = list(issns)
+        if "" in issns:
+            # Missing identifiers factorize to their own code, which is turned into -1 below
+            empty = issns.index("")
+        else:
+            empty = None
+        tables["issns"] = issns
+
+        journal_issn_codes = issn_codes[:len(journal_issns)]
+        relational_codes = issn_codes[len(journal_issns):].reshape(2, len(pairs))
+        if empty is not None:
+            relational_codes = np.where(relational_codes == empty, -1, relational_codes)
+        arrays["relational_issn_1"] = relational_codes[0].astype(np.int32)
+        arrays["relational_issn_2"] = relational_codes[1].astype(np.int32)
+
+        journal_rows = journal_issns.index.to_numpy()
+        arrays["journal_issn_indptr"] = cls.buildIndptr(journal_rows, len(journals_df))
+        arrays["journal_issn_indices"] = journal_issn_codes.astype(np.int32)
+
+        # Categories are (name, quartile) keys, areas are names
+        category_keys = pd.concat([
+            categories_df.reindex(columns=["name", "quartile"]),
+            journal_categories_df.reindex(columns=["name", "quartile"]),
+            area_categories_df.reindex(columns=["name", "quartile"]),
+        ])
+        category_keys["quartile"] = cls.readQuartiles(category_keys["quartile"])
+        category_keys = category_keys.drop_duplicates().reset_index(drop=True)
+        category_index = {key: code for code, key in enumerate(zip(category_keys["name"], category_keys["quartile"]))}
+
+        codes, uniques = pd.factorize(category_keys["name"])
+        arrays["category_names"] = codes.astype(np.int32)
+        tables["categoryNames"] = [str(value) for value in uniques]
+        codes, uniques = pd.factorize(category_keys["quartile"])
+        arrays["category_quartiles"] = codes.astype(np.int32)
+        tables["quartiles"] = [str(value) for value in uniques]
+
+        area_names = pd.concat([
+            areas_df.reindex(columns=["name"])["name"],
+            journal_areas_df.reindex(columns=["name"])["name"],
+            area_categories_df.reindex(columns=["area"])["area"],
+        ]).dropna().drop_duplicates()
+        tables["areaNames"] = [str(value) for value in area_names]
+        area_index = {name: code for code, name in enumerate(tables["areaNames"])}
+
+        # Relational journal links as CSR adjacency, in both directions of the graph join
+        pair_index = pd.Index(pairs["identifier_1"] + "\0" + pairs["identifier_2"])
+
+        links = cls.readPairs(journal_categories_df)
+        quartiles = cls.readQuartiles(journal_categories_df["quartile"])
+        relational_category = pd.DataFrame({
+            "row": pair_index.get_indexer(links["identifier_1"] + "\0" + links["identifier_2"]),
+            "code": [category_index[key] for key in zip(journal_categories_df["name"], quartiles)],
+        })
+
+        links = cls.readPairs(journal_areas_df)
+        relational_area = pd.DataFrame({
+            "row": pair_index.get_indexer(links["identifier_1"] + "\0" + links["identifier_2"]),
+            "code": [area_index[name] for name in journal_areas_df["name"]],
+        })
+
+        journal_relational = cls.joinJournals(journal_rows, journal_issn_codes, arrays)
+
+        for name, links in (("category", relational_category), ("area", relational_area)):
+            links = links[links["row"] >= 0].drop_duplicates()
+            links = links.sort_values("row", kind="stable")
+            arrays[f"relational_{name}_indptr"] = cls.buildIndptr(links["row"].to_numpy(), len(pairs))
+            arrays[f"relational_{name}_indices"] = links["code"].to_numpy(np.int32)
+
+            journal_links = journal_relational.merge(links, left_on="relational", right_on="row")
+            journal_links = journal_links[["journal", "code"]].drop_duplicates().sort_values("journal", kind="stable")
+            arrays[f"journal_{name}_indptr"] = cls.buildIndptr(journal_links["journal"].to_numpy(), len(journals_df))
+            arrays[f"journal_{name}_indices"] = journal_links["code"].to_numpy(np.int32)
+
+        arrays["area_category_areas"] = np.array(
+            [area_index[name] for name in area_categories_df.get("area", [])], dtype=np.int32)
+        quartiles = cls.readQuartiles(area_categories_df.get("quartile", pd.Series(dtype=object)))
+        arrays["area_category_categories"] = np.array(
+            [category_index[key] for key in zip(area_categories_df.get("name", []), quartiles)], dtype=np.int32)
+
+        return cls(arrays, tables)
+
+    @classmethod
+    def readPairs(cls, df):
+        return pd.DataFrame({
+            "identifier_1": df["identifier_1"].fillna("").astype(str) if "identifier_1" in df else pd.Series(dtype=str),
+            "identifier_2": df["identifier_2"].fillna("").astype(str) if "identifier_2" in df else pd.Series(dtype=str),
+        })
+
+    @classmethod
+    def readQuartiles(cls, quartiles):
+        return quartiles.astype(object).where(quartiles.notna(), None)
+
+    @classmethod
+    def buildIndptr(cls, rows, count):
+        indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=count), out=indptr[1:])
+        return indptr
+
+    @classmethod
+    def joinJournals(cls, journal_rows, journal_issn_codes, arrays):
+        journal_issns = pd.DataFrame({"journal": journal_rows, "issn": journal_issn_codes})
+        relational_rows = np.arange(len(arrays["relational_issn_1"]))
+        relational_issns = pd.DataFrame({
+            "relational": np.concatenate([relational_rows, relational_rows]),
+            "issn": np.concatenate([arrays["relational_issn_1"], arrays["relational_issn_2"]]),
+        })
+        relational_issns = relational_issns[relational_issns["issn"] >= 0]
+
+        return journal_issns.merge(relational_issns, on="issn")[["journal", "relational"]].drop_duplicates()
+
+    def getJournalCount(self):
+        return len(self.tables["titles"])
+
+    def getRelationalCount(self):
+        return len(self.arrays["relational_issn_1"])
+
+    def expandRows(self, name):
+        indptr = self.arrays[name + "_indptr"]
+        return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+    def matchTable(self, table, codes, matches):
+        # Code -1 marks a missing value and never matches
+        return np.append(matches, False)[codes]
+
+    def searchTable(self, table, term):
+        index = self.searchIndexes.get(table)
+        if index is None:
+            index = self.searchIndexes.setdefault(table, TrigramIndex(self.tables[table]))
+
+        mask = np.zeros(len(index), dtype=bool)
+        mask[index.search(term)] = True
+
+        return mask
+
+    def getTitleMask(self, partialTitle):
+        return self.searchTable("titles", partialTitle)
+
+    def getPublisherMask(self, partialName):
+        matches = self.searchTable("publishers", partialName)
+        return self.matchTable("publishers", self.arrays["journal_publishers"], matches)
+
+    def getLicenceMask(self, licenses):
+        if not licenses:
+            return np.ones(self.getJournalCount(), dtype=bool)
+
+        licenses = set(licenses)
+        matches = np.array([not licenses.isdisjoint(value.split(", ")) for value in self.tables["licences"]],
+                           dtype=bool)
+        return self.matchTable("licences", self.arrays["journal_licences"], matches)
+
+    def getSealMask(self):
+        return np.asarray(self.arrays["journal_seal"], dtype=bool)
+
+    def getAPCMask(self):
+        return np.asarray(self.arrays["journal_apc"], dtype=bool)
+
+    def getCategoryMask(self, category_ids=None, quartiles=None):
+        mask = np.ones(len(self.arrays["category_names"]), dtype=bool)
+        if category_ids is not None:
+            names = np.array([name in category_ids for name in self.tables["categoryNames"]], dtype=bool)
+            mask &= self.matchTable("categoryNames", self.arrays["category_names"], names)
+        if quartiles is not None:
+            values = np.array([quartile in quartiles for quartile in self.tables["quartiles"]], dtype=bool)
+            # Categories without a quartile carry code -1 and only match an explicit None
+            values = np.append(values, None in quartiles)
+            mask &= values[self.arrays["category_quartiles"]]
+
+        return mask
+
+    def getAreaMask(self, area_ids=None):
+        if area_ids is None:
+            return np.ones(len(self.tables["areaNames"]), dtype=bool)
+
+        return np.array([name in area_ids for name in self.tables["areaNames"]], dtype=bool)
+
+    def getRelationalWithCategories(self, category_mask):
+        mask = np.zeros(self.getRelationalCount(), dtype=bool)
+        hits = category_mask[self.arrays["relational_category_indices"]]
+        mask[self.expandRows("relational_category")[hits]] = True
+
+        return mask
+
+    def getRelationalWithAreas(self, area_mask):
+        mask = np.zeros(self.getRelationalCount(), dtype=bool)
+        hits = area_mask[self.arrays["relational_area_indices"]]
+        mask[self.expandRows("relational_area")[hits]] = True
+
+        return mask
+
+    def getJournalsOfRelational(self, relational_mask):
+        issn_mask = np.zeros(len(self.tables["issns"]) + 1, dtype=bool)
+        issn_mask[self.arrays["relational_issn_1"][relational_mask]] = True
+        issn_mask[self.arrays["relational_issn_2"][relational_mask]] = True
+        issn_mask[-1] = False
+
+        mask = np.zeros(self.getJournalCount(), dtype=bool)
+        hits = issn_mask[self.arrays["journal_issn_indices"]]
+        mask[self.expandRows("journal_issn")[hits]] = True
+
+        return mask
+
+    def getAreaCategoryPairs(self):
+        return np.asarray(self.arrays["area_category_areas"]), np.asarray(self.arrays["area_category_categories"])
+
+    def buildJournals(self, rows):
+        tables = self.tables
+        arrays = self.arrays
+
+        if self.languageTuples is None:
+            languages = [tuple(sys.intern(item) for item in value.split(", ") if item) for value in tables["languages"]]
+            self.languageTuples = languages + [()]
+        publishers = self.getValues("publishers")
+        licences = self.getValues("licences")
+
+        shared_categories = {}
+        shared_areas = {}
+
+        journals = []
+        for row in np.asarray(rows).tolist():
+            ids = [item for item in tables["identifiers"][row].split(",") if item]
+            categories = self.getSharedEntities("category", row, shared_categories)
+            areas = self.getSharedEntities("area", row, shared_areas)
+
+            journal = Journal(ids, tables["titles"][row], self.languageTuples[arrays["journal_languages"][row]],
+                              publishers[arrays["journal_publishers"][row]], bool(arrays["journal_seal"][row]),
+                              licences[arrays["journal_licences"][row]], bool(arrays["journal_apc"][row]),
+                              categories, areas)
+            journals.append(journal)
+
+        return journals
+
+    def buildRelationalJournal(self, row):
+        issns = self.tables["issns"]
+        codes = (self.arrays["relational_issn_1"][row], self.arrays["relational_issn_2"][row])
+        ids = [issns[code] for code in codes if code >= 0]
+
+        categories = tuple(self.getCategoryObjects()[code] for code in self.getLinks("relational_category", row))
+        areas = tuple(self.getAreaObjects()[code] for code in self.getLinks("relational_area", row))
+
+        return Journal(ids, "", (), None, False, "", False, categories, areas)
+
+    def buildCategories(self, codes):
+        objects = self.getCategoryObjects()
+        return [objects[code] for code in np.asarray(codes).tolist()]
+
+    def buildAreas(self, codes):
+        objects = self.getAreaObjects()
+        return [objects[code] for code in np.asarray(codes).tolist()]
+
+    def getLinks(self, name, row):
+        indptr = self.arrays[name + "_indptr"]
+        return self.arrays[name + "_indices"][indptr[row]:indptr[row + 1]].tolist()
+
+    def getSharedEntities(self, name, row, shared):
+        # Journals linked to the same entities share one immutable tuple
+        key = tuple(self.getLinks("journal_" + name, row))
+        entities = shared.get(key)
+        if entities is None:
+            objects = self.getCategoryObjects() if name == "category" else self.getAreaObjects()
+            entities = shared.setdefault(key, tuple(objects[code] for code in key))
+
+        return entities
+
+    def getValues(self, table):
+        # Code -1 indexes the trailing None, so missing values need no special case
+        values = self.values.get(table)
+        if values is None:
+            values = self.values.setdefault(table, [sys.intern(value) for value in self.tables[table]] + [None])
+
+        return values
+
+    def getCategoryObjects(self):
+        if self.categoryObjects is None:
+            names = self.getValues("categoryNames")
+            quartiles = self.getValues("quartiles")
+            self.categoryObjects = [
+                Category.intern(names[name], quartiles[quartile])
+                for name, quartile in zip(self.arrays["category_names"].tolist(),
+                                          self.arrays["category_quartiles"].tolist())
+            ]
+
+        return self.categoryObjects
+
+    def getAreaObjects(self):
+        if self.areaObjects is None:
+            self.areaObjects = [Area.intern(name) for name in self.tables["areaNames"]]
+
+        return self.areaObjects
+
+    def lookup(self, id):
+        if self.lookups is None:
+            self.lookups = self.buildLookups()
+
+        for kind in ("journal", "area", "category", "relational"):
+            code = self.lookups[kind].get(id)
+            if code is not None:
+                return kind, code
+
+        return None
+
+    def buildLookups(self):
+        issns = list(self.tables["issns"])
+
+        journals = {}
+        for row, code in zip(self.expandRows("journal_issn").tolist(), self.arrays["journal_issn_indices"].tolist()):
+            journals.setdefault(issns[code], row)
+
+        relational = {}
+        for column in ("relational_issn_1", "relational_issn_2"):
+            for row, code in enumerate(self.arrays[column].tolist()):
+                if code >= 0:
+                    relational.setdefault(issns[code], row)
+
+        # Like the SQL lookup, a category name resolves to its first quartile, missing quartiles first
+        names = self.getValues("categoryNames")
+        quartiles = self.getValues("quartiles")
+        category_names = self.arrays["category_names"].tolist()
+        category_quartiles = self.arrays["category_quartiles"].tolist()
+
+        categories = {}
+        order = sorted(range(len(category_names)),
+                       key=lambda code: (category_quartiles[code] >= 0, quartiles[category_quartiles[code]] or ""))
+        for code in order:
+            categories.setdefault(names[category_names[code]], code)
+
+        areas = {name: code for code, name in enumerate(self.tables["areaNames"])}
+
+        return {"journal": journals, "area": areas, "category": categories, "relational": relational}
+
+    def save(self, path):
+        return self.saveColumns(path, self.arrays, self.tables)
+
+    @classmethod
+    def open(cls, path):
+        columns = cls.openColumns(path)
+        if columns is None:
+            return None
+
+        manifest, arrays, tables = columns
+
+        return cls(arrays, tables)
+
+    @classmethod
+    def saveColumns(cls, path, arrays, tables, **metadata):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        # Every save goes to a fresh generation, so processes still mapping the old files are not disturbed
+        generation = Path(tempfile.mkdtemp(prefix="generation-", dir=path))
+        for name, array in arrays.items():
+            np.save(generation / f"{name}.npy", np.ascontiguousarray(array))
+        for name, table in tables.items():
+            if not isinstance(table, StringTable):
+                table = StringTable.fromStrings(table)
+            np.save(generation / f"{name}.data.npy", table.data)
+            np.save(generation / f"{name}.offsets.npy", table.offsets)
+
+        manifest = {"version": cls.VERSION, "generation": generation.name,
+                    "arrays": sorted(arrays), "tables": sorted(tables), **metadata}
+        previous = cls.readManifest(path)
+        cls.writeJson(path / "manifest.json", manifest)
+
+        for entry in path.glob("generation-*"):
+            if entry.name not in (generation.name, previous and previous.get("generation")):
+                shutil.rmtree(entry, ignore_errors=True)
+
+        return True
+
+    @classmethod
+    def openColumns(cls, path):
+        path = Path(path)
+        manifest = cls.readManifest(path)
+        if manifest is None or manifest.get("version") != cls.VERSION:
+            return None
+
+        generation = path / manifest["generation"]
+        arrays = {name: np.load(generation / f"{name}.npy", mmap_mode="r") for name in manifest["arrays"]}
+        tables = {
+            name: StringTable(np.load(generation / f"{name}.data.npy", mmap_mode="r"),
+                              np.load(generation / f"{name}.offsets.npy", mmap_mode="r"))
+            for name in manifest["tables"]
+        }
+
+        return manifest, arrays, tables
+
+    @classmethod
+    def readManifest(cls, path):
+        try:
+            with open(Path(path) / "manifest.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def writeJson(cls, target, value):
+        fd, temporary = tempfile.mkstemp(prefix=".manifest-", dir=target.parent)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(temporary, target)
+
+    @classmethod
+    def saveSources(cls, path, store, frames, key=None, rebuild=True):
+        # Each upload handler only sees its own store, so it leaves its frames behind for the other one
+        frames = dict(zip(cls.SOURCES[store], frames))
+        if key is not None:
+            # The frames only hold the rows just uploaded, the rest of the store comes from the previous source
+            previous = cls.openSources(path, store)
+            if previous is not None:
+                for name, df in frames.items():
+                    kept_df = previous[name][~previous[name][key].isin(df[key])]
+                    frames[name] = pd.concat([kept_df, df], ignore_index=True)
+
+        arrays, tables, columns = cls.encodeFrames(frames)
+        cls.saveColumns(Path(path) / "sources" / store, arrays, tables, frames=columns)
+
+        return cls.compileSources(path) if rebuild else True
+
+    @classmethod
+    def openSources(cls, path, store, columns=None):
+        stored = cls.openColumns(Path(path) / "sources" / store)
+        if stored is None:
+            return None
+
+        manifest, arrays, tables = stored
+
+        return cls.decodeFrames(arrays, tables, manifest["frames"], columns)
+
+    @classmethod
+    def compileSources(cls, path):
+        graph = cls.openSources(path, "graph")
+        relational = cls.openSources(path, "relational")
+        if graph is None or relational is None:
+            return False
+
+        frames = [graph[name] for name in cls.SOURCES["graph"]]
+        frames.extend(relational[name] for name in cls.SOURCES["relational"])
+
+        return cls.fromFrames(*frames).save(path)
+
+    @classmethod
+    def encodeFrames(cls, frames):
+        # Source columns are stored like the snapshot: codes into a table of distinct strings, -1 when missing
+        arrays = {}
+        tables = {}
+        columns = {}
+        for name, df in frames.items():
+            columns[name] = [str(column) for column in df.columns]
+            for column in df.columns:
+                codes, uniques = pd.factorize(df[column])
+                arrays[f"{name}.{column}"] = codes.astype(np.int32)
+                tables[f"{name}.{column}"] = [str(value) for value in uniques]
+
+        return arrays, tables, columns
+
+    @classmethod
+    def decodeFrames(cls, arrays, tables, frames, columns=None):
+        decoded = {}
+        for name, names in frames.items():
+            names = [column for column in names if columns is None or column in columns]
+            data = {}
+            for column in names:
+                # The trailing None is what the -1 code of a missing value points at
+                values = np.array(list(tables[f"{name}.{column}"]) + [None], dtype=object)
+                data[column] = values[np.asarray(arrays[f"{name}.{column}"])]
+            decoded[name] = pd.DataFrame(data, columns=names)
+
+        return decoded
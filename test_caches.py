@@ -0,0 +1,111 @@
+import asyncio
+import json
+import tempfile
+import unittest
+from os import sep
+
+from impl import CategoryUploadHandler, CategoryQueryHandler
+from impl import ResultCache, cached
+
+# These tests need no Blazegraph: the cached handler is a CategoryQueryHandler over a temporary
+# SQLite file, and the async path is checked on a small handler that counts its calls.
+
+CATEGORIES = [
+    {"identifiers": ["1111-0001", "1111-0002"], "categories": [{"id": "Law", "quartile": "Q1"}],
+     "areas": ["Social Sciences"]},
+    {"identifiers": ["1111-0003"], "categories": [{"id": "Oncology", "quartile": "Q2"}], "areas": ["Medicine"]},
+]
+
+class CountingHandler:
+    def __init__(self):
+        self.cache = ResultCache()
+        self.calls = 0
+
+    @cached
+    async def getValues(self, values):
+        self.calls += 1
+        return sorted(values)
+
+class TestResultCache(unittest.TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResultCache(maxSize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(cache.get("a"), (True, 1))
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.get("c"), (True, 3))
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = ResultCache(ttl=0)
+        cache.put("a", 1)
+
+        self.assertEqual(cache.get("a"), (False, None))
+        self.assertEqual(cache.getStats()["size"], 0)
+
+    def test_stats_count_hits_and_misses(self):
+        cache = ResultCache(maxSize=4, ttl=None)
+        cache.put("a", 1)
+        cache.get("a")
+        cache.get("b")
+
+        self.assertEqual(cache.getStats(), {"hits": 1, "misses": 1, "size": 1, "maxSize": 4, "ttl": None})
+
+    def test_async_methods_are_cached(self):
+        handler = CountingHandler()
+
+        self.assertEqual(asyncio.run(handler.getValues({"b", "a"})), ["a", "b"])
+        self.assertEqual(asyncio.run(handler.getValues({"a", "b"})), ["a", "b"])
+        self.assertEqual(handler.calls, 1)
+
+class TestCachedHandler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        self.category = self.directory.name + sep + "scimago.json"
+        with open(self.category, "w", encoding="utf-8") as f:
+            json.dump(CATEGORIES, f)
+
+        self.relational = self.directory.name + sep + "relational.db"
+        self.upload = CategoryUploadHandler()
+        self.upload.setDbPathOrUrl(self.relational)
+        self.assertTrue(self.upload.pushDataToDb(self.category))
+
+        self.query = CategoryQueryHandler()
+        self.query.setDbPathOrUrl(self.relational)
+        self.query.enableCache()
+        self.addCleanup(self.query.close)
+
+    def test_repeated_calls_are_served_from_the_cache(self):
+        self.query.getCategoriesWithQuartile({"Q1", "Q2"})
+        self.query.getCategoriesWithQuartile({"Q2", "Q1"})
+
+        self.assertEqual(self.query.getCacheStats()["hits"], 1)
+        self.assertEqual(self.query.getCacheStats()["misses"], 1)
+
+    def test_callers_get_their_own_copy(self):
+        df = self.query.getAllAreas()
+        df.loc[0, "name"] = "Changed"
+
+        self.assertNotIn("Changed", self.query.getAllAreas()["name"].tolist())
+
+    def test_upload_invalidates_the_cache(self):
+        self.assertEqual(len(self.query.getAllAreas()), 2)
+
+        with open(self.category, "w", encoding="utf-8") as f:
+            json.dump(CATEGORIES[:1], f)
+        self.assertTrue(self.upload.pushDataToDb(self.category))
+
+        self.assertEqual(len(self.query.getAllAreas()), 1)
+
+    def test_disabled_cache_is_bypassed(self):
+        self.query.disableCache()
+        self.query.getAllAreas()
+
+        self.assertIsNone(self.query.getCacheStats())
+
+if __name__ == "__main__":
+    unittest.main()
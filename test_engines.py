@@ -0,0 +1,378 @@
+import io
+import json
+import tempfile
+import unittest
+from os import sep
+
+import pandas as pd
+
+from impl import JournalUploadHandler, CategoryUploadHandler, CategoryQueryHandler
+from impl import FullQueryEngine
+
+# These tests need no Blazegraph: the graph store is stood in for by FrameJournalHandler,
+# which answers the JournalQueryHandler methods from a DataFrame, while the relational
+# store is a real SQLite file built by CategoryUploadHandler.
+
+JOURNALS = """Journal title,Journal ISSN (print version),Journal EISSN (online version),\
+Languages in which the journal accepts manuscripts,Publisher,DOAJ Seal,Journal license,APC
+Journal of Law,1111-0001,1111-0002,English,Law Press,Yes,CC BY,No
+Études Médicales,1111-0003,,French,Université de Lyon,No,"CC BY, CC BY-SA",Yes
+Oncology Letters,,1111-0004,English,Medical Press,Yes,CC BY-NC,Yes
+History Review,1111-0005,1111-0006,"English, German",Law Press,No,CC BY,No
+Computing Today,1111-0007,,English,Tech House,No,CC BY-NC-ND,No
+Legal Studies,1111-0008,1111-0009,Spanish,,Yes,CC BY-SA,No
+"""
+
+CATEGORIES = [
+    {"identifiers": ["1111-0001", "1111-0002"], "categories": [{"id": "Law", "quartile": "Q1"}],
+     "areas": ["Social Sciences"]},
+    {"identifiers": ["1111-0003"],
+     "categories": [{"id": "Oncology", "quartile": "Q2"}, {"id": "Law", "quartile": "Q3"}],
+     "areas": ["Medicine"]},
+    {"identifiers": ["1111-0004"], "categories": [{"id": "Oncology", "quartile": "Q1"}], "areas": ["Medicine"]},
+    {"identifiers": ["1111-0005", "1111-0006"], "categories": [{"id": "History", "quartile": "Q1"}],
+     "areas": ["Arts and Humanities", "Social Sciences"]},
+    {"identifiers": ["1111-0008"], "categories": [{"id": "Law", "quartile": "Q2"}], "areas": ["Social Sciences"]},
+    {"identifiers": ["2222-0001"], "categories": [{"id": "History", "quartile": "Q4"}],
+     "areas": ["Arts and Humanities"]},
+]
+
+def readRows():
+    return pd.read_csv(io.StringIO(JOURNALS), keep_default_na=False, dtype=str)
+
+def readJournals():
+    return JournalUploadHandler().buildSourceFrame(readRows())
+
+class FrameJournalHandler:
+    def __init__(self, df):
+        self.subjects = df["subject"].reset_index(drop=True)
+        self.df = df.drop(columns="subject").reset_index(drop=True)
+        self.calls = []
+
+    def getDbPathOrUrl(self):
+        return "frame://journals"
+
+    def select(self, call, mask=None):
+        self.calls.append(call)
+        df = self.df if mask is None else self.df[mask]
+        return df.reset_index(drop=True)
+
+    def getIssns(self):
+        return self.df["identifier"].str.split(",")
+
+    def getById(self, id):
+        return self.select("getById", self.getIssns().apply(lambda issns: id in issns))
+
+    def getByIds(self, ids):
+        return self.getJournalsByIds(ids)
+
+    def getJournalsByIds(self, ids):
+        ids = set(ids)
+        return self.select("getJournalsByIds", self.getIssns().apply(lambda issns: not ids.isdisjoint(issns)))
+
+    def getAllJournals(self):
+        return self.select("getAllJournals")
+
+    def getIdentifiers(self):
+        self.calls.append("getIdentifiers")
+        issns = self.getIssns().explode()
+        return pd.DataFrame({"id": issns[issns != ""].tolist()})
+
+    def getSearchTerms(self):
+        return self.select("getSearchTerms")[["identifier", "title", "publisher"]]
+
+    def getFlags(self):
+        return self.select("getFlags")[["identifier", "seal", "licence", "apc"]]
+
+    def getJournalsWithTitle(self, partialTitle):
+        return self.select("getJournalsWithTitle", self.df["title"].str.lower().str.contains(partialTitle.lower()))
+
+    def getJournalsPublishedBy(self, partialName):
+        return self.select("getJournalsPublishedBy", self.df["publisher"].str.lower().str.contains(partialName.lower()))
+
+    def getJournalsWithLicense(self, licenses):
+        if not licenses:
+            return self.select("getJournalsWithLicense")
+        licenses = set(licenses)
+        tokens = self.df["licence"].str.split(", ")
+        return self.select("getJournalsWithLicense", tokens.apply(lambda items: not licenses.isdisjoint(items)))
+
+    def getJournalsWithAPC(self):
+        return self.select("getJournalsWithAPC", self.df["apc"] == "Yes")
+
+    def getJournalsWithoutAPC(self):
+        return self.select("getJournalsWithoutAPC", self.df["apc"] == "No")
+
+    def getJournalsWithDOAJSeal(self):
+        return self.select("getJournalsWithDOAJSeal", self.df["seal"] == "Yes")
+
+    def iterJournalPages(self, batchSize=1000):
+        self.calls.append("iterJournalPages")
+        df = self.df.assign(journal=self.subjects).sort_values("journal").reset_index(drop=True)
+        for start in range(0, len(df), batchSize):
+            yield df.iloc[start:start + batchSize].reset_index(drop=True)
+
+    def countAllJournals(self):
+        return len(self.select("countAllJournals"))
+
+    def countJournalsWithLicense(self, licenses):
+        return len(self.getJournalsWithLicense(licenses))
+
+    def countJournalsWithoutAPC(self):
+        return len(self.getJournalsWithoutAPC())
+
+class EngineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        category = self.directory.name + sep + "scimago.json"
+        with open(category, "w", encoding="utf-8") as f:
+            json.dump(CATEGORIES, f)
+
+        self.relational = self.directory.name + sep + "relational.db"
+        upload = CategoryUploadHandler()
+        upload.setDbPathOrUrl(self.relational)
+        self.assertTrue(upload.pushDataToDb(category))
+
+        self.journals_df = readJournals()
+        self.journals = FrameJournalHandler(self.journals_df)
+        self.categories = CategoryQueryHandler()
+        self.categories.setDbPathOrUrl(self.relational)
+        self.addCleanup(self.categories.close)
+
+    def buildEngine(self, engine=None):
+        engine = engine or FullQueryEngine(workers=1)
+        engine.addJournalHandler(self.journals)
+        engine.addCategoryHandler(self.categories)
+        return engine
+
+    def getIssns(self, journals):
+        return sorted(tuple(sorted(journal.getIds())) for journal in journals)
+
+    def getExpectedIssns(self, df):
+        return sorted(tuple(sorted(issn for issn in identifier.split(",") if issn)) for identifier in df["identifier"])
+
+class TestBitmapFilters(EngineTestCase):
+    def test_standalone_filters_are_served_from_upload_bitmaps(self):
+        snapshot = self.directory.name + sep + "snapshot"
+        upload = JournalUploadHandler()
+        upload.setSnapshotPath(snapshot)
+        upload.saveSourceChunk(readRows())
+
+        engine = self.buildEngine()
+        engine.enableIndexes()
+        engine.setSnapshotPath(snapshot)
+
+        df = self.journals_df
+        self.assertEqual(self.getIssns(engine.getJournalsWithDOAJSeal()),
+                         self.getExpectedIssns(df[df["seal"] == "Yes"]))
+        self.assertEqual(self.getIssns(engine.getJournalsWithAPC()), self.getExpectedIssns(df[df["apc"] == "Yes"]))
+        self.assertEqual(self.getIssns(engine.getJournalsWithLicense({"CC BY-SA"})),
+                         self.getExpectedIssns(df[df["licence"].str.contains("CC BY-SA")]))
+
+        # The graph store is only asked for the matching journals, never scanned or filtered
+        self.assertEqual(set(self.journals.calls), {"getJournalsByIds"})
+
+    def test_bitmaps_without_snapshot_are_filled_once(self):
+        engine = self.buildEngine()
+        engine.enableIndexes()
+
+        engine.getJournalsWithDOAJSeal()
+        engine.getJournalsWithAPC()
+        engine.getJournalsWithLicense({"CC BY"})
+
+        self.assertEqual(self.journals.calls.count("getFlags"), 1)
+        self.assertNotIn("getJournalsWithDOAJSeal", self.journals.calls)
+
+    def test_filters_without_indexes_run_in_the_store(self):
+        engine = self.buildEngine()
+
+        df = self.journals_df
+        self.assertEqual(self.getIssns(engine.getJournalsWithDOAJSeal()),
+                         self.getExpectedIssns(df[df["seal"] == "Yes"]))
+        self.assertEqual(self.journals.calls, ["getJournalsWithDOAJSeal"])
+
+    def test_broad_matches_run_in_the_store(self):
+        engine = self.buildEngine()
+        engine.enableIndexes()
+        engine.FETCH_LIMIT = 2
+
+        journals = engine.getJournalsWithLicense({"CC BY", "CC BY-SA", "CC BY-NC", "CC BY-NC-ND"})
+
+        self.assertEqual(self.getIssns(journals), self.getExpectedIssns(self.journals_df))
+        self.assertIn("getJournalsWithLicense", self.journals.calls)
+        self.assertNotIn("getJournalsByIds", self.journals.calls)
+
+    def test_empty_licence_filter_skips_the_bitmaps(self):
+        engine = self.buildEngine()
+        engine.enableIndexes()
+
+        self.assertEqual(self.getIssns(engine.getJournalsWithLicense(set())), self.getExpectedIssns(self.journals_df))
+        self.assertEqual(self.journals.calls, ["getJournalsWithLicense"])
+
+class TestSearchIndex(EngineTestCase):
+    def getExpectedMatches(self, column, term):
+        df = self.journals_df
+        return self.getExpectedIssns(df[df[column].str.lower().str.contains(term)])
+
+    def test_searches_are_served_from_the_index(self):
+        engine = self.buildEngine()
+        engine.enableIndexes()
+
+        self.assertEqual(self.getIssns(engine.getJournalsWithTitle("LAW")), self.getExpectedMatches("title", "law"))
+        self.assertEqual(self.getIssns(engine.getJournalsPublishedBy("press")),
+                         self.getExpectedMatches("publisher", "press"))
+
+        self.assertEqual(self.journals.calls.count("getSearchTerms"), 1)
+        self.assertNotIn("getJournalsWithTitle", self.journals.calls)
+        self.assertNotIn("getJournalsPublishedBy", self.journals.calls)
+
+    def test_searches_without_indexes_run_in_the_store(self):
+        engine = self.buildEngine()
+
+        self.assertEqual(self.getIssns(engine.getJournalsWithTitle("law")), self.getExpectedMatches("title", "law"))
+        self.assertEqual(self.journals.calls, ["getJournalsWithTitle"])
+
+class TestMashups(EngineTestCase):
+    def buildEngine(self, engine=None):
+        # Unrelated journals make the graph side larger than the relational one, as it is in the real stores
+        filler_df = pd.DataFrame({
+            "title": [f"Filler {number}" for number in range(20)],
+            "identifier": [f"3333-{number:04d}," for number in range(20)],
+            "languages": "English", "publisher": "Filler Press", "seal": "No", "licence": "CC BY", "apc": "No",
+            "subject": [f"3333-{number:04d}" for number in range(20)],
+        })
+
+        engine = super().buildEngine(engine)
+        engine.addJournalHandler(FrameJournalHandler(filler_df))
+        return engine
+
+    def getRelationalIssns(self, areas=None, categories=None, quartiles=None):
+        issns = set()
+        for entry in CATEGORIES:
+            if areas is not None and areas.isdisjoint(entry["areas"]):
+                continue
+            if categories is not None and not any(category["id"] in categories and category["quartile"] in quartiles
+                                                  for category in entry["categories"]):
+                continue
+            issns.update(entry["identifiers"])
+
+        return issns
+
+    def getExpectedJournals(self, issns, mask=None):
+        df = self.journals_df if mask is None else self.journals_df[mask]
+        matched = df["identifier"].str.split(",").apply(lambda ids: not issns.isdisjoint(ids))
+        return self.getExpectedIssns(df[matched])
+
+    def getCases(self):
+        df = self.journals_df
+        licensed = df["licence"].str.split(", ").apply(lambda items: not {"CC BY", "CC BY-SA"}.isdisjoint(items))
+        return [
+            ("getJournalsInCategoriesWithQuartile", ({"Law", "Oncology"}, {"Q1", "Q3"}),
+             self.getExpectedJournals(self.getRelationalIssns(None, {"Law", "Oncology"}, {"Q1", "Q3"}))),
+            ("getJournalsInAreasWithLicense", ({"Social Sciences", "Medicine"}, {"CC BY", "CC BY-SA"}),
+             self.getExpectedJournals(self.getRelationalIssns({"Social Sciences", "Medicine"}), licensed)),
+            ("getDiamondJournalsInAreasAndCategoriesWithQuartile", ({"Social Sciences"}, {"Law", "History"}, {"Q1"}),
+             self.getExpectedJournals(self.getRelationalIssns({"Social Sciences"}, {"Law", "History"}, {"Q1"}),
+                                      df["apc"] == "No")),
+            ("getJournalsInCategoriesWithQuartile", ({"Surgery"}, {"Q1"}), []),
+        ]
+
+    def assertMashups(self, engine, joins):
+        for (method, args, expected), join in zip(self.getCases(), joins):
+            with self.subTest(method=method, args=args):
+                self.assertEqual(engine.explain(method, *args)["join"], join)
+                self.assertEqual(self.getIssns(getattr(engine, method)(*args)), expected)
+
+    def test_selective_relational_side_is_pushed_down(self):
+        engine = self.buildEngine()
+        engine.PUSHDOWN_LIMIT = 10
+
+        self.assertMashups(engine, ["pushdown", "pushdown", "pushdown", "empty"])
+        self.assertNotIn("getAllJournals", self.journals.calls)
+
+    def test_small_graph_side_is_fetched_with_the_relational_rows(self):
+        engine = self.buildEngine()
+
+        self.assertMashups(engine, ["memory", "memory", "memory", "empty"])
+        self.assertNotIn("getJournalsByIds", self.journals.calls)
+        self.assertIn("getAllJournals", self.journals.calls)
+
+    def test_broad_relational_side_is_joined_in_memory(self):
+        engine = self.buildEngine()
+        engine.PUSHDOWN_LIMIT = 0
+
+        self.assertMashups(engine, ["memory", "memory", "memory", "empty"])
+        self.assertNotIn("getJournalsByIds", self.journals.calls)
+
+    def test_bitmaps_give_the_same_answers(self):
+        engine = self.buildEngine()
+        engine.enableIndexes()
+        engine.PUSHDOWN_LIMIT = 10
+
+        self.assertMashups(engine, ["pushdown", "pushdown", "pushdown", "empty"])
+        self.assertNotIn("countJournalsWithLicense", self.journals.calls)
+
+class TestEntitiesByIds(EngineTestCase):
+    IDS = ["1111-0002", "1111-0004", "Law", "Medicine", "2222-0001", "missing", "1111-0002"]
+
+    def describe(self, entity):
+        if entity is None:
+            return None
+        return type(entity).__name__, tuple(sorted(entity.getIds())), getattr(entity, "title", None)
+
+    def assertSameAsSingleLookups(self, engine):
+        entities = engine.getEntitiesByIds(self.IDS)
+
+        self.assertEqual(list(entities), list(dict.fromkeys(self.IDS)))
+        for id, entity in entities.items():
+            with self.subTest(id=id):
+                self.assertEqual(self.describe(entity), self.describe(engine.getEntityById(id)))
+
+    def test_bulk_lookup_matches_single_lookups(self):
+        self.assertSameAsSingleLookups(self.buildEngine())
+
+    def test_bulk_lookup_with_the_directory(self):
+        engine = self.buildEngine()
+        engine.enableIndexes()
+
+        self.assertSameAsSingleLookups(engine)
+
+    def test_bulk_lookup_asks_each_store_once(self):
+        engine = self.buildEngine()
+        engine.getEntitiesByIds(self.IDS)
+
+        self.assertEqual(self.journals.calls, ["getJournalsByIds"])
+
+    def test_lookups_share_the_interned_entities(self):
+        engine = self.buildEngine()
+        area = engine.getEntityById("Medicine")
+        category = engine.getEntitiesByIds(["Law"])["Law"]
+
+        self.assertTrue(any(item is area for item in engine.getAllAreas()))
+        self.assertTrue(any(item is category for item in engine.getAllCategories()))
+
+class TestIterAllJournals(EngineTestCase):
+    def test_pages_cover_every_journal_once(self):
+        engine = self.buildEngine()
+
+        pages = list(engine.iterAllJournals(4))
+
+        self.assertEqual([len(page) for page in pages], [4, 2])
+        self.assertEqual(self.getIssns(journal for page in pages for journal in page),
+                         self.getExpectedIssns(self.journals_df))
+
+    def test_journals_of_overlapping_handlers_are_merged(self):
+        engine = self.buildEngine()
+        engine.addJournalHandler(FrameJournalHandler(self.journals_df.iloc[2:]))
+        engine.addJournalHandler(FrameJournalHandler(self.journals_df.iloc[::2]))
+
+        pages = list(engine.iterAllJournals(3))
+
+        self.assertEqual([len(page) for page in pages], [3, 3])
+        self.assertEqual(self.getIssns(journal for page in pages for journal in page),
+                         self.getExpectedIssns(self.journals_df))
+
+if __name__ == "__main__":
+    unittest.main()
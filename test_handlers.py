@@ -0,0 +1,325 @@
+import copy
+import io
+import json
+import sqlite3
+import tempfile
+import threading
+import unittest
+from os import sep
+
+import pandas as pd
+
+from impl import JournalUploadHandler, CategoryUploadHandler, JournalQueryHandler, CategoryQueryHandler
+from impl import invalidateCaches
+
+# These tests need no Blazegraph: the SQLite side is used as it is, while the triple store is
+# stood in for by MemoryJournalUploadHandler, which keeps the uploaded triples in a dict, and by
+# RecordingJournalQueryHandler, which records the queries it would have sent.
+
+JOURNALS = """Journal title,Journal ISSN (print version),Journal EISSN (online version),\
+Languages in which the journal accepts manuscripts,Publisher,DOAJ Seal,Journal license,APC
+Journal of Law,1111-0001,1111-0002,English,Law Press,Yes,CC BY,No
+Études Médicales,1111-0003,,French,L'Université de Lyon,No,"CC BY, CC BY-SA",Yes
+Oncology Letters,,1111-0004,English,Medical Press,Yes,CC BY-NC,Yes
+"""
+
+CATEGORIES = [
+    {"identifiers": ["1111-0001", "1111-0002"], "categories": [{"id": "Law", "quartile": "Q1"}],
+     "areas": ["Social Sciences"]},
+    {"identifiers": ["1111-0003"],
+     "categories": [{"id": "Oncology", "quartile": "Q2"}, {"id": "Law", "quartile": "Q3"}],
+     "areas": ["Medicine"]},
+    {"identifiers": ["1111-0004"], "categories": [{"id": "O'Neill Studies", "quartile": ""}], "areas": ["Medicine"]},
+    {"identifiers": ["1111-0005", "1111-0006"], "categories": [{"id": "History", "quartile": "Q1"}],
+     "areas": ["Arts and Humanities", "Social Sciences"]},
+]
+
+class HandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+        self.relational = self.directory.name + sep + "relational.db"
+        self.assertTrue(self.pushCategories(CATEGORIES))
+
+        self.query = CategoryQueryHandler()
+        self.query.setDbPathOrUrl(self.relational)
+        self.addCleanup(self.query.close)
+
+    def pushCategories(self, data, upsert=False, upload=None):
+        category = self.directory.name + sep + "scimago.json"
+        with open(category, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+        upload = upload or CategoryUploadHandler(upsert)
+        upload.setDbPathOrUrl(self.relational)
+        return upload.pushDataToDb(category)
+
+class MemoryJournalUploadHandler(JournalUploadHandler):
+    def __init__(self, upsert=False):
+        super().__init__(upsert=upsert)
+        self.triples = {}
+
+    def getStoredTriples(self, endpoint, subjects):
+        return {subject: set(self.triples[subject]) for subject in subjects if subject in self.triples}
+
+    def updateTriples(self, endpoint, deletes, inserts):
+        for line in deletes:
+            self.triples[line[:line.index(" ")]].discard(line)
+        for line in inserts:
+            self.triples.setdefault(line[:line.index(" ")], set()).add(line)
+
+class RecordingJournalQueryHandler(JournalQueryHandler):
+    def __init__(self, missing=()):
+        super().__init__()
+        self.missing = list(missing)
+        self.queries = []
+
+    def runQuery(self, query):
+        self.queries.append(query)
+        if query == self.LAYOUT_QUERY:
+            return pd.DataFrame({"missing": self.missing})
+        return pd.DataFrame()
+
+class TestConnectionPool(HandlerTestCase):
+    def test_connection_is_reused_within_a_thread(self):
+        self.assertIs(self.query.getConnection(), self.query.getConnection())
+
+    def test_each_thread_gets_its_own_connection(self):
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(self.query.getConnection()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(connections[0], self.query.getConnection())
+        self.assertEqual(len(self.query.connections), 2)
+
+    def test_connections_are_read_only(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.query.getConnection().execute("DELETE FROM journals")
+
+    def test_close_releases_every_connection(self):
+        con = self.query.getConnection()
+        self.assertTrue(self.query.close())
+
+        self.assertEqual(self.query.connections, [])
+        with self.assertRaises(sqlite3.ProgrammingError):
+            con.execute("SELECT 1")
+        self.assertEqual(len(self.query.getAllAreas()), 3)
+
+    def test_new_location_opens_new_connections(self):
+        con = self.query.getConnection()
+        self.query.setDbPathOrUrl(self.relational)
+
+        self.assertIsNot(con, self.query.getConnection())
+
+class TestSchema(HandlerTestCase):
+    def getPlan(self, query, params=()):
+        con = self.query.getConnection()
+        return " ".join(row[-1] for row in con.execute("EXPLAIN QUERY PLAN " + query, params))
+
+    def test_secondary_indexes_are_created(self):
+        con = self.query.getConnection()
+        indexes = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+        self.assertTrue({"journals_identifier_1", "journals_identifier_2", "categories_name_quartile",
+                         "categories_quartile", "journals_categories_category", "journals_areas_area",
+                         "areas_categories_category"}.issubset(indexes))
+
+    def test_issn_lookups_use_an_index(self):
+        self.assertIn("INDEX", self.getPlan("SELECT id FROM journals WHERE identifier_2 = ?", ("1111-0002",)))
+        self.assertIn("INDEX", self.getPlan("SELECT id FROM categories WHERE quartile = ?", ("Q1",)))
+
+    def test_empty_quartiles_are_stored_as_null(self):
+        con = self.query.getConnection()
+        rows = con.execute("SELECT quartile FROM categories WHERE name = ?", ("O'Neill Studies",)).fetchall()
+
+        self.assertEqual(rows, [(None,)])
+
+    def test_categories_are_unique_by_name_and_quartile(self):
+        con = sqlite3.connect(self.relational)
+        self.addCleanup(con.close)
+
+        with self.assertRaises(sqlite3.IntegrityError):
+            con.execute("INSERT INTO categories (name, quartile) VALUES (?, ?)", ("Law", "Q1"))
+
+class TestUpsert(HandlerTestCase):
+    def getJournalCategories(self):
+        df = self.query.getAllJournalCategories().fillna("")
+        return sorted(df.itertuples(index=False, name=None))
+
+    def test_unchanged_categories_are_not_rewritten(self):
+        upload = CategoryUploadHandler(upsert=True)
+        self.assertTrue(self.pushCategories(CATEGORIES, upload=upload))
+
+        self.assertEqual(upload.getStats(), {"journals": 4, "inserted": 0, "updated": 0, "unchanged": 4})
+
+    def test_upsert_matches_a_full_upload(self):
+        data = copy.deepcopy(CATEGORIES)
+        data[0]["categories"] = [{"id": "Law", "quartile": "Q2"}]
+        data.append({"identifiers": ["1111-0007"], "categories": [{"id": "History", "quartile": "Q4"}],
+                     "areas": ["Arts and Humanities"]})
+
+        upload = CategoryUploadHandler(upsert=True)
+        self.assertTrue(self.pushCategories(data, upload=upload))
+        self.assertEqual(upload.getStats(), {"journals": 5, "inserted": 1, "updated": 1, "unchanged": 3})
+        upserted = self.getJournalCategories()
+
+        self.assertTrue(self.pushCategories(data))
+        self.assertEqual(upserted, self.getJournalCategories())
+
+    def test_upsert_migrates_a_store_without_keyed_ids(self):
+        # The first uploader wrote every table with to_sql, so no id column is a primary key
+        self.relational = self.directory.name + sep + "baseline.db"
+        with sqlite3.connect(self.relational) as con:
+            pd.DataFrame({"id": [1], "identifier_1": ["1111-0001"], "identifier_2": ["1111-0002"]}).to_sql(
+                "journals", con, index=False)
+            pd.DataFrame({"id": [1], "name": ["Law"], "quartile": ["Q1"]}).to_sql("categories", con, index=False)
+            pd.DataFrame({"id": [1], "name": ["Social Sciences"]}).to_sql("areas", con, index=False)
+            pd.DataFrame({"journal_id": [1], "category_id": [1]}).to_sql("journals_categories", con, index=False)
+            pd.DataFrame({"journal_id": [1], "area_id": [1]}).to_sql("journals_areas", con, index=False)
+            pd.DataFrame({"area_id": [1], "category_id": [1]}).to_sql("areas_categories", con, index=False)
+        con.close()
+
+        data = [CATEGORIES[0], {"identifiers": ["3333-0001"], "categories": [{"id": "Oncology", "quartile": "Q2"}],
+                                "areas": ["Medicine"]}]
+        self.assertTrue(self.pushCategories(data, upsert=True))
+
+        self.query.setDbPathOrUrl(self.relational)
+        con = self.query.getConnection()
+        self.assertNotIn((None,), con.execute("SELECT id FROM journals").fetchall())
+        self.assertEqual(self.query.getJournalsByCategoryWithQuartile({"Oncology"}, {"Q2"}).values.tolist(),
+                         [["3333-0001", None]])
+        self.assertEqual(self.query.getJournalsByCategoryWithQuartile({"Law"}, {"Q1"}).values.tolist(),
+                         [["1111-0001", "1111-0002"]])
+
+    def test_journal_triples_are_only_written_when_they_change(self):
+        journal = self.directory.name + sep + "doaj.csv"
+        df = pd.read_csv(io.StringIO(JOURNALS), keep_default_na=False, dtype=str)
+        df.to_csv(journal, index=False)
+
+        upload = MemoryJournalUploadHandler(upsert=True)
+        upload.setDbPathOrUrl("memory://graph")
+        self.assertTrue(upload.pushDataToDb(journal))
+        triples = copy.deepcopy(upload.triples)
+
+        self.assertTrue(upload.pushDataToDb(journal))
+        self.assertEqual((upload.getStats()["inserted"], upload.getStats()["deleted"]), (0, 0))
+        self.assertEqual(upload.getStats()["unchanged"], 3)
+        self.assertEqual(upload.triples, triples)
+
+        df.loc[0, "Publisher"] = "Law House"
+        df.to_csv(journal, index=False)
+        self.assertTrue(upload.pushDataToDb(journal))
+        self.assertEqual((upload.getStats()["inserted"], upload.getStats()["deleted"]), (1, 1))
+        self.assertEqual(upload.getStats()["unchanged"], 2)
+
+class TestParameterizedQueries(HandlerTestCase):
+    def test_statement_text_does_not_depend_on_the_values(self):
+        first, first_params = self.query.buildJournalsByAreaAndCategoryWithQuartileQuery(
+            {"Medicine"}, {"Law"}, {"Q1"})
+        second, second_params = self.query.buildJournalsByAreaAndCategoryWithQuartileQuery(
+            {"Social Sciences", "Medicine"}, {"Law", "Oncology"}, {"Q2", "Q3"})
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first_params, second_params)
+
+    def test_quotes_in_names_are_bound_not_spliced(self):
+        df = self.query.getAreasAssignedToCategories({"O'Neill Studies"})
+        self.assertEqual(df["name"].tolist(), ["Medicine"])
+
+        df = self.query.getCategoriesAssignedToAreas({"Medicine') OR 1=1 --"})
+        self.assertTrue(df.empty)
+
+    def test_null_quartiles_can_be_requested(self):
+        df = self.query.getCategoriesWithQuartile({None, "Q2"})
+
+        self.assertEqual(sorted(df["name"].tolist()), ["O'Neill Studies", "Oncology"])
+
+    def test_journals_by_category_and_area(self):
+        df = self.query.getJournalsByAreaAndCategoryWithQuartile({"Social Sciences"}, {"Law", "History"}, {"Q1"})
+        ids = sorted(df.itertuples(index=False, name=None))
+
+        self.assertEqual(ids, [("1111-0001", "1111-0002"), ("1111-0005", "1111-0006")])
+
+class TestLookupTables(HandlerTestCase):
+    def getRows(self, query):
+        con = self.query.getConnection()
+        return sorted(con.execute(query).fetchall(), key=repr)
+
+    def assertLookupTablesMatch(self):
+        self.assertEqual(self.getRows("SELECT issn, name, quartile FROM issn_categories"), self.getRows("""
+            SELECT journal_issns.issn, categories.name, categories.quartile
+            FROM journal_issns
+            JOIN journals_categories ON journals_categories.journal_id = journal_issns.journal_id
+            JOIN categories ON categories.id = journals_categories.category_id
+        """))
+        self.assertEqual(self.getRows("SELECT issn, name FROM issn_areas"), self.getRows("""
+            SELECT journal_issns.issn, areas.name
+            FROM journal_issns
+            JOIN journals_areas ON journals_areas.journal_id = journal_issns.journal_id
+            JOIN areas ON areas.id = journals_areas.area_id
+        """))
+
+    def test_lookup_tables_follow_the_uploaded_links(self):
+        self.assertLookupTablesMatch()
+
+        df = self.query.getCategoriesOfJournals({"1111-0002", "1111-0003"})
+        self.assertEqual(sorted(df["name"].tolist()), ["Law", "Law", "Oncology"])
+
+    def test_lookup_tables_are_refreshed_by_an_upsert(self):
+        data = copy.deepcopy(CATEGORIES)
+        data[1]["areas"] = ["Medicine", "Social Sciences"]
+        self.assertTrue(self.pushCategories(data, upsert=True))
+
+        self.assertLookupTablesMatch()
+        self.assertEqual(sorted(self.query.getJournalAreas({"1111-0003"})["name"].tolist()),
+                         ["Medicine", "Social Sciences"])
+
+    def test_stores_without_lookup_tables_get_them_on_upsert(self):
+        with sqlite3.connect(self.relational) as con:
+            con.executescript("DELETE FROM issn_categories; DELETE FROM issn_areas;")
+        con.close()
+
+        self.assertTrue(self.pushCategories(CATEGORIES, upsert=True))
+
+        self.assertLookupTablesMatch()
+        self.assertEqual(len(self.query.getJournalCategories({"1111-0001"})), 1)
+
+class TestLegacyJournalFilters(unittest.TestCase):
+    def buildHandler(self, missing=()):
+        handler = RecordingJournalQueryHandler(missing)
+        handler.setDbPathOrUrl("memory://graph")
+        return handler
+
+    def test_exact_match_triples_are_used_when_present(self):
+        handler = self.buildHandler()
+        handler.getJournalsByIds(["1111-0001"])
+        handler.getJournalsWithLicense({"CC BY"})
+
+        self.assertIn("schema:issn ?id", handler.queries[1])
+        self.assertIn("Property:P275> ?licenceTerm", handler.queries[2])
+        self.assertEqual(handler.queries.count(handler.LAYOUT_QUERY), 1)
+
+    def test_older_stores_are_matched_on_the_literals(self):
+        handler = self.buildHandler(["issn", "licence"])
+        handler.getById("1111-0001")
+        handler.countJournalsWithLicense({"CC BY"})
+
+        self.assertNotIn("schema:issn", handler.queries[1])
+        self.assertIn('CONCAT(",", ?id, ",")', handler.queries[1])
+        self.assertIn('CONCAT(", ", ?licenceTerm, ", ")', handler.queries[2])
+
+    def test_layout_is_checked_again_after_an_upload(self):
+        handler = self.buildHandler(["issn"])
+        handler.getById("1111-0001")
+        handler.missing = []
+
+        invalidateCaches("memory://graph")
+        handler.getById("1111-0001")
+
+        self.assertEqual(handler.queries.count(handler.LAYOUT_QUERY), 2)
+        self.assertIn("schema:issn ?id", handler.queries[-1])
+
+if __name__ == "__main__":
+    unittest.main()
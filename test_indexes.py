@@ -0,0 +1,101 @@
+import unittest
+
+from impl import TrigramIndex, SearchIndex, BitmapIndex, foldText
+
+# These tests need no Blazegraph: the indexes are filled directly from Python lists.
+
+TITLES = ["Journal of Law", "Études Médicales", "Oncology Letters", "History Review", None, "Law"]
+
+FLAGS = {
+    "seal": ["Yes", "No", "Yes", "No", "No", "Yes", "No", "No", "No", "Yes"],
+    "licence": [["CC BY"], ["CC BY", "CC BY-SA"], ["CC BY-NC"], ["CC BY"], ["CC BY-NC-ND"],
+                ["CC BY-SA"], [], ["CC BY"], ["CC BY-NC", "CC BY-SA"], ["CC BY"]],
+}
+
+class TestTrigramIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = TrigramIndex(TITLES)
+
+    def scan(self, term):
+        return [position for position, value in enumerate(TITLES) if foldText(term) in foldText(value)]
+
+    def test_search_matches_a_substring_scan(self):
+        for term in ("law", "LAW", "etudes", "médic", "o", "ry", "journal of", "review x", "", "zzz"):
+            with self.subTest(term=term):
+                self.assertEqual(self.index.search(term).tolist(), self.scan(term))
+
+    def test_trigrams_out_of_order_do_not_match(self):
+        self.assertEqual(self.index.search("lawof").tolist(), [])
+
+    def test_accents_and_case_are_folded(self):
+        self.assertEqual(foldText("Études"), "etudes")
+        self.assertEqual(foldText(None), "")
+
+class TestSearchIndex(unittest.TestCase):
+    def test_unfilled_index_reports_a_miss(self):
+        self.assertEqual(SearchIndex().search("title", "law"), (False, None))
+
+    def test_search_returns_the_identifiers_of_matches(self):
+        index = SearchIndex()
+        index.fill(["a", "b", "c"], {"title": ["Law", "History", "Law Review"]})
+
+        self.assertEqual(index.search("title", "law"), (True, ["a", "c"]))
+
+    def test_expired_index_reports_a_miss(self):
+        index = SearchIndex(ttl=0)
+        index.fill(["a"], {"title": ["Law"]})
+
+        self.assertEqual(index.search("title", "law"), (False, None))
+
+    def test_cleared_index_reports_a_miss(self):
+        index = SearchIndex()
+        index.fill(["a"], {"title": ["Law"]})
+        index.clear()
+
+        self.assertEqual(index.search("title", "law"), (False, None))
+
+class TestBitmapIndex(unittest.TestCase):
+    def setUp(self):
+        self.identifiers = [f"1111-{position:04d}" for position in range(len(FLAGS["seal"]))]
+        self.index = BitmapIndex()
+        self.index.fill(self.identifiers, FLAGS)
+
+    def scan(self, allOf=(), anyOf=(), noneOf=()):
+        def has(position, key):
+            column, value = key
+            values = FLAGS[column][position]
+            return value in values if isinstance(values, list) else value == values
+
+        return [identifier for position, identifier in enumerate(self.identifiers)
+                if all(has(position, key) for key in allOf)
+                and (not anyOf or any(has(position, key) for key in anyOf))
+                and not any(has(position, key) for key in noneOf)]
+
+    def test_matches_agree_with_a_scan(self):
+        queries = [
+            {"allOf": [("seal", "Yes")]},
+            {"anyOf": [("licence", "CC BY-SA"), ("licence", "CC BY-NC")]},
+            {"allOf": [("seal", "No")], "anyOf": [("licence", "CC BY")], "noneOf": [("licence", "CC BY-SA")]},
+            {"noneOf": [("seal", "Yes")]},
+            {},
+        ]
+        for query in queries:
+            with self.subTest(query=query):
+                expected = self.scan(**query)
+                self.assertEqual(self.index.match(**query), (True, expected))
+                self.assertEqual(self.index.count(**query), (True, len(expected)))
+
+    def test_unknown_values_match_nothing(self):
+        self.assertEqual(self.index.match(allOf=[("licence", "GPL")]), (True, []))
+        self.assertEqual(self.index.count(noneOf=[("licence", "GPL")]), (True, len(self.identifiers)))
+
+    def test_expired_or_cleared_index_reports_a_miss(self):
+        index = BitmapIndex(ttl=0)
+        index.fill(self.identifiers, FLAGS)
+        self.assertEqual(index.match(allOf=[("seal", "Yes")]), (False, None))
+
+        self.index.clear()
+        self.assertEqual(self.index.count(allOf=[("seal", "Yes")]), (False, None))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+from os import sep
+from pathlib import Path
+
+import pandas as pd
+
+from impl import Journal, Category, Area
+from impl import JournalUploadHandler, CategoryUploadHandler, SnapshotQueryEngine, Snapshot
+from test_engines import EngineTestCase, readRows
+from test_handlers import MemoryJournalUploadHandler
+
+# These tests need no Blazegraph: they reuse the frame-backed journal handler and the SQLite
+# store of test_engines, and compare the snapshot engine with FullQueryEngine on the same data,
+# or a snapshot compiled from upload sources with one built from the stores.
+
+QUERIES = [
+    ("getAllJournals",),
+    ("getJournalsWithTitle", "law"),
+    ("getJournalsPublishedBy", "press"),
+    ("getJournalsWithLicense", {"CC BY", "CC BY-NC"}),
+    ("getJournalsWithAPC",),
+    ("getJournalsWithDOAJSeal",),
+    ("getAllCategories",),
+    ("getAllAreas",),
+    ("getCategoriesWithQuartile", {"Q1", "Q2"}),
+    ("getCategoriesAssignedToAreas", {"Medicine"}),
+    ("getAreasAssignedToCategories", {"Law"}),
+    ("getJournalsInCategoriesWithQuartile", {"Law", "Oncology"}, {"Q1", "Q2"}),
+    ("getJournalsInAreasWithLicense", {"Social Sciences"}, {"CC BY"}),
+    ("getDiamondJournalsInAreasAndCategoriesWithQuartile", {"Medicine", "Social Sciences"}, {"Law"}, {"Q1", "Q3"}),
+]
+
+def describe(entity):
+    if entity is None:
+        return None
+    if isinstance(entity, Category):
+        return ("category", tuple(entity.getIds()), entity.getQuartile())
+    if isinstance(entity, Area):
+        return ("area", tuple(entity.getIds()))
+    if isinstance(entity, Journal):
+        return ("journal", tuple(sorted(entity.getIds())), entity.getTitle(), tuple(entity.getLanguages()),
+                entity.getPublisher(), entity.hasDOAJSeal(), entity.getLicence(), entity.hasAPC(),
+                tuple(sorted(describe(category) for category in entity.getCategories())),
+                tuple(sorted(describe(area) for area in entity.getAreas())))
+    return sorted((describe(item) for item in entity), key=repr)
+
+class TestSnapshotQueryEngine(EngineTestCase):
+    def assertSameAnswers(self, engine):
+        expected = self.buildEngine()
+        for method, *args in QUERIES:
+            with self.subTest(method=method):
+                self.assertEqual(describe(getattr(engine, method)(*args)), describe(getattr(expected, method)(*args)))
+
+        for id in ("1111-0002", "Law", "Medicine", "2222-0001", "missing"):
+            with self.subTest(id=id):
+                self.assertEqual(describe(engine.getEntityById(id)), describe(expected.getEntityById(id)))
+
+    def test_snapshot_answers_match_the_stores(self):
+        self.assertSameAnswers(self.buildEngine(SnapshotQueryEngine(workers=1)))
+
+    def test_snapshot_is_built_once(self):
+        engine = self.buildEngine(SnapshotQueryEngine(workers=1))
+        engine.getJournalsWithAPC()
+        engine.getJournalsWithTitle("law")
+
+        self.assertEqual(self.journals.calls, ["getAllJournals"])
+
+    def test_saved_snapshot_answers_without_the_stores(self):
+        snapshot = self.directory.name + sep + "snapshot"
+        self.assertTrue(self.buildEngine(SnapshotQueryEngine(workers=1)).saveSnapshot(snapshot))
+        self.journals.calls.clear()
+
+        engine = self.buildEngine(SnapshotQueryEngine(workers=1, snapshotPath=snapshot))
+        engine.getAllJournals()
+        engine.getJournalsWithLicense({"CC BY"})
+        self.assertEqual(self.journals.calls, [])
+
+        self.assertSameAnswers(engine)
+
+    def test_journal_getters_return_lists(self):
+        for engine in (self.buildEngine(), self.buildEngine(SnapshotQueryEngine(workers=1))):
+            journal = engine.getEntityById("1111-0003")
+            for values in (journal.getLanguages(), journal.getCategories(), journal.getAreas()):
+                with self.subTest(engine=type(engine).__name__):
+                    self.assertIsInstance(values, list)
+
+            journal.getCategories().clear()
+            self.assertEqual(len(journal.getCategories()), 2)
+
+    def test_missing_snapshot_opens_as_none(self):
+        self.assertIsNone(Snapshot.open(self.directory.name + sep + "missing"))
+
+class TestSnapshotSources(EngineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.snapshot = self.directory.name + sep + "snapshot"
+
+    def emitRelationalSources(self):
+        upload = CategoryUploadHandler()
+        upload.setDbPathOrUrl(self.relational)
+        upload.setSnapshotPath(self.snapshot)
+        return upload.emitSnapshot()
+
+    def emitSources(self):
+        self.emitRelationalSources()
+
+        upload = JournalUploadHandler()
+        upload.setSnapshotPath(self.snapshot)
+        upload.saveSourceChunk(readRows())
+        return upload.emitSnapshot()
+
+    def assertSameJournals(self, engine):
+        expected = self.buildEngine(SnapshotQueryEngine(workers=1))
+        self.assertEqual(describe(engine.getAllJournals()), describe(expected.getAllJournals()))
+        self.assertEqual(describe(engine.getJournalsInCategoriesWithQuartile({"Law"}, {"Q1", "Q3"})),
+                         describe(expected.getJournalsInCategoriesWithQuartile({"Law"}, {"Q1", "Q3"})))
+
+    def test_sources_keep_their_values_and_missing_cells(self):
+        frames = [pd.DataFrame({"subject": ["a", "b", "c"], "title": ["Law", None, "Law"]})]
+        self.assertFalse(Snapshot.saveSources(self.snapshot, "graph", frames))
+
+        journals_df = Snapshot.openSources(self.snapshot, "graph")["journals"]
+        self.assertEqual(journals_df["subject"].tolist(), ["a", "b", "c"])
+        self.assertEqual(journals_df["title"].isna().tolist(), [False, True, False])
+        self.assertEqual(journals_df["title"].dropna().tolist(), ["Law", "Law"])
+        self.assertEqual(Snapshot.openSources(self.snapshot, "graph", ["title"])["journals"].columns.tolist(),
+                         ["title"])
+
+    def test_sources_are_merged_by_subject(self):
+        first = pd.DataFrame({"subject": ["a", "b"], "title": ["Law", "History"]})
+        second = pd.DataFrame({"subject": ["b", "c"], "title": ["History Review", "Oncology"]})
+        Snapshot.saveSources(self.snapshot, "graph", [first], key="subject")
+        Snapshot.saveSources(self.snapshot, "graph", [second], key="subject")
+
+        journals_df = Snapshot.openSources(self.snapshot, "graph")["journals"]
+        self.assertEqual(sorted(zip(journals_df["subject"], journals_df["title"])),
+                         [("a", "Law"), ("b", "History Review"), ("c", "Oncology")])
+
+    def test_upload_sources_compile_into_a_snapshot(self):
+        self.assertTrue(self.emitSources())
+
+        files = [path.name for path in Path(self.snapshot).rglob("*") if path.is_file()]
+        self.assertTrue(all(name.endswith(".npy") or name == "manifest.json" for name in files))
+
+        self.assertSameJournals(self.buildEngine(SnapshotQueryEngine(workers=1, snapshotPath=self.snapshot)))
+
+    def test_chunked_upload_saves_its_sources_as_it_goes(self):
+        self.emitRelationalSources()
+        journal = self.directory.name + sep + "doaj.csv"
+        readRows().to_csv(journal, index=False)
+
+        upload = MemoryJournalUploadHandler(upsert=True)
+        upload.batchSize = 2
+        upload.setDbPathOrUrl("memory://graph")
+        upload.setSnapshotPath(self.snapshot)
+        self.assertTrue(upload.pushDataToDb(journal))
+
+        journals_df = Snapshot.openSources(self.snapshot, "graph")["journals"]
+        self.assertEqual(sorted(journals_df["subject"]), sorted(self.journals_df["subject"]))
+        self.assertSameJournals(self.buildEngine(SnapshotQueryEngine(workers=1, snapshotPath=self.snapshot)))
+
+    def test_old_generations_are_pruned(self):
+        for _ in range(3):
+            self.emitSources()
+
+        self.assertLessEqual(len(list(Path(self.snapshot).glob("generation-*"))), 2)
+        self.assertIsNotNone(Snapshot.open(self.snapshot))
+
+if __name__ == "__main__":
+    unittest.main()